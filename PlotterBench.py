@@ -0,0 +1,81 @@
+######################################
+# PLOTTER BENCHMARK ##################
+# BY: ALEXANDER HEDRICK ##############
+######################################
+
+# Times the plot style setup done at the start of every plot_data call:
+#   style.use  - plt.style.use with the style sheets on every plot (the old behaviour)
+#   resolve    - first use of a style in the registry (style_params, once per session)
+#   registry   - style_context with the already-resolved style (every later plot)
+# times a LaTeX (usetex) save against a fast text (mathtext) save for the
+# science styles, and checks that plotting in a style leaves the global rcParams
+# untouched.
+# Run: python PlotterBench.py [repeats]
+
+import io
+import shutil
+import sys
+import timeit
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import PlotterClass
+from PlotterClass import PLOT_STYLES, style_params, style_context
+
+def sheet_names(plotstyle):
+    # The style sheet names plot_data used to pass to plt.style.use
+    return [next(name for name in names if name in plt.style.library)
+            for names in PLOT_STYLES[plotstyle]
+            if any(name in plt.style.library for name in names)]
+
+def time_per_call(func, repeats):
+    return min(timeit.repeat(func, number=repeats, repeat=5)) / repeats * 1e3 # ms
+
+def enter_context(plotstyle):
+    with style_context(plotstyle):
+        pass
+
+def save_labelled(plotstyle, fast_text):
+    # One small figure with a title, axis labels and tick labels, saved to memory
+    with style_context(plotstyle, fast_text):
+        fig = PlotterClass.new_figure((4, 3), headless=True)
+        ax = fig.subplots()
+        ax.plot([0, 1], [0, 1])
+        ax.set_title(r'$\alpha = 0.5$')
+        ax.set_xlabel(r'Time $t$ (s)')
+        fig.savefig(io.BytesIO(), format='png', dpi=150)
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    print(f"{'style':14s}{'style.use':>12s}{'resolve':>12s}{'registry':>12s}{'saved':>10s}   (ms per plot)")
+    for plotstyle in PLOT_STYLES:
+        names = sheet_names(plotstyle)
+        with matplotlib.rc_context(): # keep the legacy calls from changing this session's style
+            legacy = time_per_call(lambda: plt.style.use(names), repeats)
+
+        PlotterClass._style_params.pop((plotstyle, False), None)
+        resolve = timeit.timeit(lambda: style_params(plotstyle), number=1) * 1e3
+        registry = time_per_call(lambda: enter_context(plotstyle), repeats)
+        print(f"{plotstyle:14s}{legacy:12.4f}{resolve:12.4f}{registry:12.4f}{legacy - registry:10.4f}")
+
+    # Text rendering: usetex runs LaTeX and dvipng for each new label (cached in
+    # matplotlib's tex.cache afterwards), fast text draws with mathtext
+    if shutil.which('latex') is None:
+        print("\nLaTeX not found. Skipping the usetex vs fast text timing.")
+    else:
+        print(f"\n{'style':14s}{'usetex':>12s}{'fast text':>12s}   (ms per save)")
+        for plotstyle in PLOT_STYLES:
+            if not dict(style_params(plotstyle)).get('text.usetex'):
+                continue
+            usetex = time_per_call(lambda: save_labelled(plotstyle, False), 5)
+            fast = time_per_call(lambda: save_labelled(plotstyle, True), 5)
+            print(f"{plotstyle:14s}{usetex:12.2f}{fast:12.2f}")
+
+    # Style isolation: drawing a figure in each style must not change global rcParams
+    before = dict(matplotlib.rcParams)
+    for plotstyle in PLOT_STYLES:
+        with style_context(plotstyle):
+            fig = PlotterClass.new_figure((4, 3), headless=True)
+            fig.subplots().plot([0, 1], [0, 1])
+    print("\nGlobal rcParams unchanged after plotting:", before == dict(matplotlib.rcParams))
@@ -13,17 +13,344 @@
 
 import data
 import numpy as np
-import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 import os
 import pickle
-from scipy.io import loadmat
+import shutil
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import MappingProxyType
 from scipy.interpolate import interp1d
 import scienceplots
+from PlotterData import DATA_EXTENSIONS, load_files, probe_files, list_sheets, sheet_key, mat_struct_to_dataframe
+
+# Shared time bases
+# plot_data gives every series its own time base spanning the x data, so series
+# of equal length (all channels of a file, repeated trials) would each allocate
+# the same np.linspace. time_base hands out one read-only array per
+# (start, end, length), keeping the most recently used few.
+TIME_BASE_CACHE_SIZE = 16
+_time_bases = OrderedDict()
+
+def time_base(start, end, n):
+    key = (float(start), float(end), int(n))
+    t = _time_bases.get(key)
+    if t is None:
+        t = np.linspace(start, end, n)
+        t.flags.writeable = False # shared, so must not be modified in place
+        _time_bases[key] = t
+        if len(_time_bases) > TIME_BASE_CACHE_SIZE:
+            _time_bases.popitem(last=False)
+    else:
+        _time_bases.move_to_end(key)
+    return t
+
+# Plot styles
+# Each plotstyle stacks one or more style sheets; a sheet lists alternative
+# names (seaborn-talk was renamed seaborn-v0_8-talk in matplotlib 3.6).
+# style_params resolves a plotstyle once per session into a frozen, validated
+# rcParams dict, and style_context applies it around a single figure and puts
+# the touched keys back afterwards. Global rcParams are never left changed, so
+# one plot's style can't leak into the next. Values are validated when the
+# style is resolved, so the context writes them with rcParams._set (private,
+# but API-stable per matplotlib's docs) instead of re-validating on every plot.
+# PlotterBench.py times this against plt.style.use.
+#
+# The science styles turn on text.usetex, so every new label is typeset by a
+# LaTeX subprocess (matplotlib keeps the results on disk in its tex.cache, so
+# this is paid once per distinct label, across sessions). fast_text keeps the
+# science look without LaTeX: mathtext with matplotlib's bundled Computer Modern
+# fonts. It is also used automatically when no latex executable is installed.
+PLOT_STYLES = {
+    'seaborn-talk': (('seaborn-v0_8-talk', 'seaborn-talk'),),
+    'science': (('science',),),
+    'science-ieee': (('science',), ('ieee',)),
+}
+DEFAULT_PLOTSTYLE = 'seaborn-talk'
+FAST_TEXT_PARAMS = {
+    'text.usetex': False,
+    'font.family': 'serif',
+    'font.serif': ['cmr10', 'STIXGeneral', 'DejaVu Serif'],
+    'mathtext.fontset': 'cm',
+    'axes.formatter.use_mathtext': True, # cmr10 has no unicode minus sign
+}
+_style_params = {}
+
+def style_params(plotstyle, fast_text=False):
+    key = (plotstyle, fast_text)
+    if key not in _style_params:
+        params = {}
+        for names in PLOT_STYLES[plotstyle]:
+            name = next((name for name in names if name in plt.style.library), None)
+            if name is None:
+                print(f"Style sheet '{names[0]}' not found (is scienceplots installed?). Skipping it.")
+                continue
+            params.update(plt.style.library[name])
+        if params.get('text.usetex') and not fast_text and shutil.which('latex') is None:
+            print(f"LaTeX not found. Using fast text (mathtext) for the {plotstyle} style.")
+            fast_text = True
+        if params.get('text.usetex') and fast_text:
+            params.update(FAST_TEXT_PARAMS)
+        _style_params[key] = MappingProxyType(dict(matplotlib.RcParams(params)))
+    return _style_params[key]
+
+@contextmanager
+def style_context(plotstyle, fast_text=False):
+    if plotstyle not in PLOT_STYLES:
+        print("Invalid plot style. Using default.")
+        plotstyle = DEFAULT_PLOTSTYLE
+    params = style_params(plotstyle, fast_text)
+    rc = matplotlib.rcParams
+    saved = {key: rc[key] for key in params}
+    for key, value in params.items():
+        rc._set(key, value)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            rc._set(key, value)
+
+# Figures
+# With headless=True plot_data draws on a bare Figure with an Agg canvas instead
+# of a pyplot figure. Nothing is registered with pyplot and no GUI backend is
+# started, so exports are cheaper and run in worker processes or on machines
+# without a display.
+# Given a plotstyle the figure is a StyledFigure: style_context only covers
+# plot_data, but a displayed window draws later (when shown, zoomed or panned),
+# and settings read at draw time (font family lists, the LaTeX preamble) would
+# fall back to the global rcParams, so the window wouldn't match the export.
+class StyledFigure(Figure):
+    # A Figure that draws and saves inside its plot style
+    def __init__(self, *args, plotstyle=DEFAULT_PLOTSTYLE, fast_text=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plotstyle = plotstyle if plotstyle in PLOT_STYLES else DEFAULT_PLOTSTYLE
+        self.fast_text = fast_text
+
+    def draw(self, renderer):
+        with style_context(self.plotstyle, self.fast_text):
+            super().draw(renderer)
+
+    def savefig(self, *args, **kwargs):
+        with style_context(self.plotstyle, self.fast_text):
+            super().savefig(*args, **kwargs)
+
+def new_figure(figsize, headless=False, plotstyle=None, fast_text=False):
+    style = {} if plotstyle is None else {'FigureClass': StyledFigure, 'plotstyle': plotstyle, 'fast_text': fast_text}
+    if headless:
+        fig = style.pop('FigureClass', Figure)(figsize=figsize, **style)
+        FigureCanvasAgg(fig)
+        return fig
+    return plt.figure(figsize=figsize, **style)
+
+class _PlotterUnpickler(pickle.Unpickler):
+    # Pickles saved by the GUI before Plotter.__getstate__ hold PlotterGUI._noop as
+    # save_data_plot. Resolving it would import the GUI, which selects the TkAgg
+    # backend and fails without a display, so it is mapped to a local no-op
+    def find_class(self, module, name):
+        if (module, name) == ('PlotterGUI', '_noop'):
+            return _noop
+        return super().find_class(module, name)
+
+def _noop(*args):
+    pass
+
+def load_pickle(f):
+    # Loads a pickled Plotter from the open file f without importing the GUI
+    return _PlotterUnpickler(f).load()
+
+def export_pickle(pickle_path, image_path, dpi=300, rasterize_lines=False):
+    # Re-renders a pickled Plotter headless and saves the image, e.g. from a batch job
+    with open(pickle_path, 'rb') as f:
+        plotter = load_pickle(f)
+    base, ext = os.path.splitext(image_path)
+    with plotter.style_context():
+        fig = plotter.plot_data(headless=True)
+        export_figure(fig, base, formats=(ext[1:] or 'png',), dpi=dpi, rasterize_lines=rasterize_lines)
+
+# Export
+# savefig(bbox_inches='tight') draws the figure an extra time to measure it, once
+# per file. export_figure lays the figure out once and reuses that tight bounding
+# box for every format and DPI. Optionally, the data lines of dense axes are
+# rasterized inside vector formats (PDF/SVG) so exports of long recordings and
+# many trials stay small and quick to write; text, axes and ticks stay vector.
+# An axes counts as dense by the total vertices of its lines and collections:
+# decimated lines have at most a few thousand points each, so it is the number
+# of lines that makes a vector file large.
+EXPORT_FORMATS = ('png', 'pdf', 'svg')
+VECTOR_FORMATS = ('pdf', 'svg', 'eps', 'ps')
+EXPORT_PAD_INCHES = 0.1
+THUMBNAIL_DPI = 50
+RASTERIZE_MIN_POINTS = 5000 # per axes
+
+def _n_points(artist):
+    if isinstance(artist, Line2D):
+        return len(artist.get_xdata())
+    return sum(len(path.vertices) for path in artist.get_paths())
+
+def export_figure(fig, base_path, formats=('png',), dpi=300, thumbnail=False, rasterize_lines=False):
+    # Writes base_path.<fmt> for each format (+ base_path_thumb.png) and returns the paths
+    fig.draw_without_rendering() # the one layout pass
+    bbox = fig.get_tightbbox().padded(EXPORT_PAD_INCHES)
+
+    dense = []
+    if rasterize_lines:
+        for ax in fig.axes:
+            data = [(artist, _n_points(artist)) for artist in (*ax.lines, *ax.collections)]
+            if sum(n for _, n in data) >= RASTERIZE_MIN_POINTS:
+                dense += [(artist, artist.get_rasterized()) for artist, n in data if n] # not the empty legend proxies
+    paths = []
+    try:
+        for fmt in formats:
+            for artist, _ in dense:
+                artist.set_rasterized(fmt in VECTOR_FORMATS)
+            path = f"{base_path}.{fmt}"
+            fig.savefig(path, format=fmt, dpi=dpi, bbox_inches=bbox)
+            paths.append(path)
+    finally:
+        for artist, rasterized in dense:
+            artist.set_rasterized(rasterized)
+    if thumbnail:
+        path = f"{base_path}_thumb.png"
+        fig.savefig(path, format='png', dpi=THUMBNAIL_DPI, bbox_inches=bbox)
+        paths.append(path)
+    return paths
+
+# Line decimation
+# A 10 kHz recording has far more samples than the saved figure has pixel
+# columns, so lines are reduced to the min and max of each pixel column
+# before they are handed to matplotlib. Keeping both extremes (in the order
+# they occur) draws the same envelope, peaks included, with a few thousand
+# vertices. Buckets are sized for the saved PNG resolution.
+DECIMATE_DPI = 300
+
+def minmax_decimate(x, y, n_buckets):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if n_buckets < 1 or n <= 2 * n_buckets:
+        return x, y
+
+    size = n // n_buckets
+    used = size * n_buckets
+    blocks = y[:used].reshape(n_buckets, size)
+    i_min = blocks.argmin(axis=1)
+    i_max = blocks.argmax(axis=1)
+    start = np.arange(n_buckets) * size
+    idx = np.column_stack((start + np.minimum(i_min, i_max),
+                           start + np.maximum(i_min, i_max))).ravel()
+    if used < n: # leftover samples form one last bucket
+        tail = y[used:]
+        idx = np.concatenate((idx, used + np.sort([tail.argmin(), tail.argmax()])))
+    return x[idx], y[idx]
+
+def crop_to_xlimits(x, y, xlimits):
+    # Slices an increasing x (and the matching y) to the samples inside xlimits,
+    # plus one sample of margin either side so lines still run to the axes edges
+    if not xlimits:
+        return x, y
+    lo, hi = sorted(xlimits)
+    start = max(np.searchsorted(x, lo, side='left') - 1, 0)
+    stop = np.searchsorted(x, hi, side='right') + 1
+    return x[start:stop], y[start:stop]
+
+def redecimate_on_zoom(sources, n_buckets):
+    # Re-decimates lines for the visible x range whenever an axes is zoomed or
+    # panned, so the interactive window shows full detail at every zoom level.
+    # sources holds (line, x, y) with the full-resolution data behind each line;
+    # x must be increasing (time base or frequency bins). A LineCollection is
+    # stored with lists of x and y arrays, one per segment.
+    # Axes sharing x (stacked panels, twin axes) form one group: matplotlib only
+    # notifies the axes that was zoomed, so its callback re-slices the lines of
+    # every axes in the group, once per new x range
+    groups = {}
+    for line, x, y in sources:
+        siblings = frozenset(line.axes.get_shared_x_axes().get_siblings(line.axes))
+        groups.setdefault(siblings, []).append((line, x, y))
+
+    for group, lines in groups.items():
+        shown = {}
+        def on_xlim_changed(ax, lines=lines, shown=shown):
+            xlim = tuple(ax.get_xlim())
+            if shown.get('xlim') == xlim: # already re-sliced for this range by a sibling
+                return
+            shown['xlim'] = xlim
+            for line, x, y in lines:
+                if isinstance(line, LineCollection): # batched series: lists of arrays
+                    line.set_segments([np.column_stack(minmax_decimate(*crop_to_xlimits(xi, yi, xlim), n_buckets))
+                                       for xi, yi in zip(x, y)])
+                else:
+                    line.set_data(*minmax_decimate(*crop_to_xlimits(x, y, xlim), n_buckets))
+        for ax in group:
+            ax.callbacks.connect('xlim_changed', on_xlim_changed)
+
+# Stacked panels
+# For many channels that don't fit on one or two axes: one row per label on a
+# shared x axis, each row STACKED_PANEL_HEIGHT inches tall unless a figure height is set.
+# Every panel crops and decimates its own lines, and zooming any panel re-slices
+# all of them (see redecimate_on_zoom).
+STACKED_PANEL_HEIGHT = 1.5 # inches
+
+# Density plots
+# Overlaying hundreds of trials as lines is slow and unreadable, so the density
+# plot bins every sample into a time x value histogram the size of the image
+# (DENSITY_DPI pixels per inch of figure) and shows it with a colormap. Each
+# series adds 1 to every time column it reaches (its samples there are weighted
+# by 1 / their count), so series of different lengths or rates weigh the same,
+# and each column is then normalised to sum to 1. The per-series mean of every
+# time column is kept for the mean/percentile lines.
+DENSITY_DPI = 100
+DENSITY_CMAP = 'viridis'
+
+def density_histogram(series, xlimits, ylimits, nx, ny):
+    x0, x1 = xlimits
+    y0, y1 = ylimits
+    counts = np.zeros(nx * ny)
+    column_means = np.full((len(series), nx), np.nan)
+    for i, (x, y) in enumerate(series):
+        keep = np.isfinite(y) & (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        x, y = x[keep], y[keep]
+        x_bin = np.minimum(((x - x0) * (nx / (x1 - x0))).astype(np.intp), nx - 1)
+        y_bin = np.minimum(((y - y0) * (ny / (y1 - y0))).astype(np.intp), ny - 1)
+        n = np.bincount(x_bin, minlength=nx)
+        counts += np.bincount(y_bin * nx + x_bin, weights=1 / n[x_bin], minlength=nx * ny)
+
+        sums = np.bincount(x_bin, weights=y, minlength=nx)
+        np.divide(sums, n, out=column_means[i], where=n > 0)
+
+    counts = counts.reshape(ny, nx)
+    totals = counts.sum(axis=0)
+    density = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+    return density, column_means
+
+# Trial statistics
+# Summarises many trials of the same signal as mean +/- std and percentile
+# bands: every trial is resampled onto one common grid and stacked into a
+# (trials x grid) array, so each statistic is a single numpy reduction.
+def resample_trials(series, xlimits, n):
+    grid = np.linspace(xlimits[0], xlimits[1], n)
+    stack = np.empty((len(series), n))
+    for i, (x, y) in enumerate(series):
+        stack[i] = np.interp(grid, x, y, left=np.nan, right=np.nan)
+    return grid, stack
+
+# Render cache
+# The arrays plot_data draws (decimated lines, bode magnitude/phase, density
+# histograms, trial statistics) are kept on the Plotter, keyed by the data
+# and numeric settings they come from but not by labels, fonts or y limits.
+# The cache is pickled with the settings, so replotting a pickle with new
+# labels skips the interpolation, FFT, smoothing and decimation work.
+# After each plot_data only the entries that plot used are kept, and
+# load_data clears it.
 
 # Plotter class
 class Plotter:
-    def __init__(self, foldername, plotstyle, verbose, title, xlabel, ylabel1, ylabel2, xlimits, ylimits1, ylimits2, legend, figsize, title_fontsize, label_fontsize, tick_fontsize, legend_fontsize, linewidth):
+    def __init__(self, foldername, plotstyle, verbose, title, xlabel, ylabel1, ylabel2, xlimits, ylimits1, ylimits2, legend, figsize, title_fontsize, label_fontsize, tick_fontsize, legend_fontsize, linewidth, storage='memory', sample_range=None, decimate=True, batch_lines=False, fast_text=False):
         self.foldername = foldername # folder name where the data is stored
         self.plotstyle = plotstyle # plot style to use
         self.title = title # title of the plot
@@ -41,6 +368,30 @@ class Plotter:
         self.tick_fontsize = tick_fontsize # tick font size
         self.legend_fontsize = legend_fontsize # legend font size
         self.linewidth = linewidth # line width for plots
+        self.storage = storage # 'memory' (DataFrames), 'memmap' (memory-mapped column cache) or 'stream' (CSV min/max envelopes)
+        self.sample_range = sample_range # (start, stop) samples to read from MATLAB v7.3 files, None for all
+        self.decimate = decimate # reduce lines to min/max per pixel column before plotting (turn off for publication exports)
+        self.batch_lines = batch_lines # draw single axis series as one LineCollection (for overlays of many trials)
+        self.fast_text = fast_text # science styles: mathtext instead of LaTeX for text (much faster drawing and saving)
+        self._render_cache = {} # render-ready arrays for plot_data (see _cached)
+
+    # Settings added since the first pickles were saved; __setstate__ gives a pickle
+    # that lacks one the default (linewidth: the GUI's default line width)
+    PICKLE_DEFAULTS = {'linewidth': 2.0, 'storage': 'memory', 'sample_range': None,
+                       'decimate': True, 'batch_lines': False, 'fast_text': False}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for attr, value in self.PICKLE_DEFAULTS.items():
+            self.__dict__.setdefault(attr, value)
+
+    def __getstate__(self):
+        # Instance overrides (the GUI replaces save_data_plot) and plot_data's scratch
+        # state are not pickled, so loading a pickle never imports the GUI
+        state = self.__dict__.copy()
+        state.pop('save_data_plot', None)
+        state.pop('_render_used', None)
+        return state
 
     def plot_pickle(self):
         # Load a previously saved pickle file containing a Plotter class instance
@@ -52,7 +403,7 @@ class Plotter:
             print(f"Pickle {i}: {file}")
         pickle_idx = int(input("\nEnter index of pickle to load: "))
         with open(os.path.join(pickle_path, pickles[pickle_idx]), 'rb') as f:
-            plotpickle = pickle.load(f)
+            plotpickle = load_pickle(f)
 
         plotpickle.foldername = self.foldername # update foldername in case moved
         plotpickle.plotstyle = self.plotstyle # update plotstyle
@@ -70,6 +421,9 @@ class Plotter:
         plotpickle.label_fontsize = self.label_fontsize # update label fontsize
         plotpickle.tick_fontsize = self.tick_fontsize # update tick fontsize
         plotpickle.legend_fontsize = self.legend_fontsize # update legend fontsize
+        plotpickle.decimate = self.decimate # update decimation setting
+        plotpickle.batch_lines = self.batch_lines # update batched line setting
+        plotpickle.fast_text = self.fast_text # update fast text setting
 
 
         plotpickle.plot_data()
@@ -77,7 +431,8 @@ class Plotter:
     def select_data(self):
         # Creates a list of files in the given folder that are xlsx or csv files,
         # then prompts user to select which files to plot. Finally, the function
-        # loads the selected files into pandas dataframes.
+        # reads the column names of the selected files (the data itself is loaded
+        # by load_data once the columns to plot have been chosen).
 
         # Print intro message
         print("\n\n")
@@ -90,7 +445,7 @@ class Plotter:
 
         # Make a list of data files
         path = self.foldername
-        self.data_files = [f for f in os.listdir(path) if f.endswith('.xlsx') or f.endswith('.csv') or f.endswith('.mat')]
+        self.data_files = [f for f in os.listdir(path) if f.endswith(DATA_EXTENSIONS)]
         data_file_len = len(self.data_files)
 
         # Prompt user to select files
@@ -106,20 +461,47 @@ class Plotter:
         except ValueError:
             print("Invalid input. Please enter comma separated indices.")
 
-        # Load the selected data files into dataframes dictionary
-        self.selected_files = [self.data_files[i] for i in self.selected_indices]
-        self.dataframes = {}
-        for file in self.selected_files:
-            name = file
-            if file.endswith('.xlsx'):
-                self.dataframes[name] = pd.read_excel(os.path.join(path, file))
-            elif file.endswith('.csv'):
-                self.dataframes[name] = pd.read_csv(os.path.join(path, file))
-            elif file.endswith('.mat'):
-                self.dataframes[name] = self.mat_struct_to_dataframe(path, file)
-                print(self.dataframes[name].head())
-
-        self.selected_files = [self.data_files[i] for i in self.selected_indices]
+        # Workbooks with more than one sheet: prompt for the sheet(s) to use
+        self.selected_files = []
+        for file in [self.data_files[i] for i in self.selected_indices]:
+            sheets = list_sheets(path, file) if file.endswith('.xlsx') else []
+            if len(sheets) < 2:
+                self.selected_files.append(file)
+                continue
+            print(f"\nSheets in {file}:")
+            for i, sheet in enumerate(sheets):
+                print(f"Sheet {i}: {sheet}")
+            sheet_idx = input(f"\nEnter index of sheet(s) to plot from {file} (comma separated, Enter for first sheet): ")
+            if not sheet_idx.strip():
+                self.selected_files.append(file)
+            else:
+                self.selected_files += [sheet_key(file, sheets[int(x)]) for x in sheet_idx.split(',')]
+
+        # Read only the column names of the selected files into schemas dictionary
+        self.schemas, errors = probe_files(path, self.selected_files)
+        for file, ex in errors.items():
+            print(f"Could not read {file}: {ex}")
+        self.selected_files = [f for f in self.selected_files if f in self.schemas]
+
+    def load_data(self):
+        # Loads the selected files (concurrently) into the dataframes dictionary
+        # and extracts the x-axis / input signal values.
+        storage = getattr(self, 'storage', 'memory')
+        if storage == 'stream' and self.plot_type not in ('single_axis', 'twin_axes'):
+            # bode, density, trial statistics and stacked panels need the real samples,
+            # not the interleaved min/max of each bucket
+            print(f"Streamed envelopes can only be drawn as single or twin axes lines, not as a {self.plot_type} plot. Loading into memory.")
+            storage = 'memory'
+        self._render_cache = {} # computed from the old data
+        self.dataframes, errors = load_files(self.foldername, self.selected_files,
+                                             columns=self.required_columns(),
+                                             progress=self._print_load_progress,
+                                             storage=storage,
+                                             sample_range=getattr(self, 'sample_range', None))
+        if errors:
+            raise ValueError("Could not load: " + ", ".join(f"{file} ({ex})" for file, ex in errors.items()))
+        # asarray: no copy, memory-mapped columns stay on disk
+        self.x_data_values = np.asarray(self.dataframes[self.x_file][self.x_data])
 
         # If verbose, print head of each dataframe
         if self.verbose:
@@ -128,29 +510,83 @@ class Plotter:
                 print(df.head())
             print("\n\n\n\n")
 
+    def required_columns(self):
+        # Returns {file: set of column names} actually referenced by the plot:
+        # the y columns in self.columns plus the x-axis / input column.
+        needed = {}
+        for file, col_tuples in self.columns.items():
+            needed.setdefault(file, set()).update(entry[0] for entry in col_tuples)
+        x_file = getattr(self, 'x_file', None)
+        if x_file is not None:
+            needed.setdefault(x_file, set()).add(self.x_data)
+        return needed
+
+    def _print_load_progress(self, done, total, file, error):
+        # Progress callback for load_files
+        if error is None:
+            print(f"[{done}/{total}] Loaded {file}")
+        else:
+            print(f"[{done}/{total}] FAILED {file}")
+
     def plot_single_axis(self):
         self.select_data()
         self.plot_type = 'single_axis'
+        self._select_single_axis_columns()
+        self.load_data()
+        self.plot_data()
+
+    def plot_density(self, show_mean=True, percentiles=(5, 95)):
+        # Same selection as plot_single_axis, drawn as a 2-D time x value histogram of
+        # all series (for hundreds of repeated trials) with optional mean/percentile lines
+        self.select_data()
+        self.plot_type = 'density'
+        self.density_mean = show_mean
+        self.density_percentiles = tuple(percentiles)
+        self._select_single_axis_columns()
+        self.load_data()
+        self.plot_data()
 
+    def plot_trial_stats(self, show_std=True, percentiles=(5, 95)):
+        # Same selection as plot_single_axis; series sharing a label are summarised
+        # as their mean with a +/- 1 std band and a percentile band (pass () for none)
+        self.select_data()
+        self.plot_type = 'trial_stats'
+        self.stats_std = show_std
+        self.stats_percentiles = tuple(percentiles)
+        self._select_single_axis_columns()
+        self.load_data()
+        self.plot_data()
+
+    def plot_stacked(self):
+        # Same selection as plot_single_axis, drawn as one panel per label stacked
+        # in rows on a shared x axis (series given the same label share a panel)
+        self.select_data()
+        self.plot_type = 'stacked'
+        self._select_single_axis_columns()
+        self.load_data()
+        self.plot_data()
+
+    def _select_single_axis_columns(self):
+        # Prompts for the x-axis column and the y column(s) + labels of each file
         # Obtain x-axis (common to all plots)
-        for i, key in enumerate(self.dataframes):
+        for i, key in enumerate(self.schemas):
             print(f"Key {i}: {key}")
         self.frame_with_x = int(input("\nEnter key of dataframe to use for x-axis: "))
-        x_key = list(self.dataframes.keys())[self.frame_with_x]
+        x_key = list(self.schemas.keys())[self.frame_with_x]
+        self.x_file = x_key
 
         # Prompt user to select x-axis from selected dataframe
         print(f"\nColumns in {x_key}:")
-        for i, col in enumerate(self.dataframes[x_key].columns):
+        for i, col in enumerate(self.schemas[x_key]):
             print(f"Column {i}: {col}")
         self.x_idx = int(input("\nEnter index of column to use for x-axis: "))
-        self.x_data = self.dataframes[x_key].columns[self.x_idx]
-        self.x_data_values = np.array(self.dataframes[x_key][self.x_data])
+        self.x_data = self.schemas[x_key][self.x_idx]
 
         # Prompt user to select y-axis from each dataframe
         self.columns = {}
-        for file, df in self.dataframes.items():
+        for file, cols in self.schemas.items():
             print(f"\nColumns in {file}:")
-            for i, col in enumerate(df.columns):
+            for i, col in enumerate(cols):
                 print(f"Column {i}: {col}")
             y_idx = input(f"\nEnter index of column(s) to plot on y-axis for {file} (comma separated): ")
             y_idx_int = [int(x) for x in y_idx.split(',')]
@@ -158,7 +594,7 @@ class Plotter:
             cur_cols = []
             for idx in y_idx_int:
                 label = input(f"\nEnter label for column {idx} for {file} (or press Enter to use column name): ")
-                cur_cols.append((df.columns[idx], label if label else df.columns[idx]))
+                cur_cols.append((cols[idx], label if label else cols[idx]))
             
             # Store as list of tuples
             self.columns[file] = tuple(cur_cols)
@@ -169,8 +605,6 @@ class Plotter:
                 for (y_col, lab) in self.columns[file]:
                     print(f"{file}: y -> {y_col}, label -> {lab}")
             print("\n\n\n\n")
-        
-        self.plot_data()
 
     def plot_twin_axes(self):
         self.select_data()
@@ -178,24 +612,24 @@ class Plotter:
         self.plot_type = 'twin_axes'
 
         # Obtain x-axis (common to both plots)
-        for i, key in enumerate(self.dataframes):
+        for i, key in enumerate(self.schemas):
             print(f"Key {i}: {key}")
         self.frame_with_x = int(input("\nEnter key of dataframe to use for x-axis: "))
-        x_key = list(self.dataframes.keys())[self.frame_with_x]
+        x_key = list(self.schemas.keys())[self.frame_with_x]
+        self.x_file = x_key
 
         # Prompt user to select x-axis from selected dataframe
         print(f"\nColumns in {x_key}:")
-        for i, col in enumerate(self.dataframes[x_key].columns):
+        for i, col in enumerate(self.schemas[x_key]):
             print(f"Column {i}: {col}")
         self.x_idx = int(input("\nEnter index of column to use for x-axis: "))
-        self.x_data = self.dataframes[x_key].columns[self.x_idx]
-        self.x_data_values = np.array(self.dataframes[x_key][self.x_data])
+        self.x_data = self.schemas[x_key][self.x_idx]
 
         # Prompt user to select y-axis from each dataframe
         self.columns = {}
-        for file, df in self.dataframes.items():
+        for file, cols in self.schemas.items():
             print(f"\nColumns in {file}:")
-            for i, col in enumerate(df.columns):
+            for i, col in enumerate(cols):
                 print(f"Column {i}: {col}")
 
             y_idx = input(f"\nEnter index of column(s) to plot on y-axis for {file} (comma separated): ")
@@ -205,7 +639,7 @@ class Plotter:
             for idx in y_idx_int:
                 label = input(f"\nEnter label for column {idx} for {file} (or press Enter to use column name): ")
                 y_axis = int(input(f"\nIs this y-axis for the first or second axis? (Enter 1 or 2): "))
-                cur_cols.append((df.columns[idx], y_axis, label if label else df.columns[idx]))
+                cur_cols.append((cols[idx], y_axis, label if label else cols[idx]))
             
             # Store as list of tuples
             self.columns[file] = tuple(cur_cols)
@@ -217,6 +651,7 @@ class Plotter:
                     print(f"{file}: y -> {y_col}, y-axis {y_ax}, label -> {lab}")
             print("\n\n\n\n")
 
+        self.load_data()
         self.plot_data()
 
     def plot_bode(self, start_freq, end_freq, sampling_rate):
@@ -230,24 +665,24 @@ class Plotter:
         self.sampling_rate = sampling_rate  # Hz, sampling rate of INPUT signal
 
         # Obtain input signal 
-        for i, key in enumerate(self.dataframes):
+        for i, key in enumerate(self.schemas):
             print(f"Key {i}: {key}")
         self.frame_with_x = int(input("\nEnter key of dataframe to use for input signal: "))
-        x_key = list(self.dataframes.keys())[self.frame_with_x]
+        x_key = list(self.schemas.keys())[self.frame_with_x]
+        self.x_file = x_key
 
         # Prompt user to select input from selected dataframe
         print(f"\nColumns in {x_key}:")
-        for i, col in enumerate(self.dataframes[x_key].columns):
+        for i, col in enumerate(self.schemas[x_key]):
             print(f"Column {i}: {col}")
         self.x_idx = int(input("\nEnter index of column to use for input signal: "))
-        self.x_data = self.dataframes[x_key].columns[self.x_idx]
-        self.x_data_values = np.array(self.dataframes[x_key][self.x_data])
+        self.x_data = self.schemas[x_key][self.x_idx]
 
         # Prompt user to select signals to use as outputs for bode plot (signals to perform fft on)
         self.columns = {}
-        for file, df in self.dataframes.items():
+        for file, cols in self.schemas.items():
             print(f"\nColumns in {file}:")
-            for i, col in enumerate(df.columns):
+            for i, col in enumerate(cols):
                 print(f"Column {i}: {col}")
             y_idx = input(f"\nEnter index of column(s) to perform fft from {file} (comma separated): ")
             y_idx_int = [int(x) for x in y_idx.split(',')]
@@ -255,7 +690,7 @@ class Plotter:
             cur_cols = []
             for idx in y_idx_int:
                 label = input(f"\nEnter label for signal {idx} for {file} (or press Enter to use column name): ")
-                cur_cols.append((df.columns[idx], label if label else df.columns[idx]))
+                cur_cols.append((cols[idx], label if label else cols[idx]))
             
             # Store as list of tuples
             self.columns[file] = tuple(cur_cols)
@@ -267,27 +702,36 @@ class Plotter:
                     print(f"{file}: y -> {y_col}, label -> {lab}")
             print("\n\n\n\n")
         
+        self.load_data()
         self.plot_data()
 
-    def plot_data(self):
-        # Plots the selected data with given customizations.
-        # Set plot style
-        if self.plotstyle == 'seaborn-talk':
-            plt.style.use('seaborn-talk')
-        elif self.plotstyle == 'science':
-            plt.style.use('science')
-        elif self.plotstyle == 'science-ieee':
-            plt.style.use(['science','ieee'])
-        else:
-            print("Invalid plot style. Using default.")
-            plt.style.use('seaborn-talk')
+    def plot_data(self, headless=False):
+        # Plots the selected data with given customizations and returns the figure.
+        # headless: draw on an Agg canvas without pyplot and skip the save prompts
+        # (the caller saves the returned figure, inside style_context for the style's savefig settings)
+        self._render_used = set()
+        try:
+            with self.style_context():
+                return self._plot_data(headless)
+        finally:
+            # drop cached arrays this plot didn't use (old limits, sizes, columns)
+            cache = self.__dict__.get('_render_cache', {})
+            for key in set(cache) - self.__dict__.pop('_render_used'):
+                del cache[key]
+
+    def style_context(self):
+        # This plot's style (see style_context at the top), for drawing and saving its figure
+        return style_context(self.plotstyle, getattr(self, 'fast_text', False))
+
+    def _plot_data(self, headless):
         colors = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple', 'tab:brown', 'tab:pink', 'tab:gray', 'tab:olive', 'tab:cyan']
-        
+        sources = [] # (line, x, y) full-resolution data behind each drawn line
 
         if self.plot_type == 'twin_axes':
             if not self.figsize:
                 self.figsize = (10, 6)
-            fig, ax1 = plt.subplots(figsize=self.figsize)
+            fig = new_figure(self.figsize, headless, self.plotstyle, getattr(self, 'fast_text', False))
+            ax1 = fig.subplots()
             ax2 = ax1.twinx()
             
             ax1_color = 'tab:blue'
@@ -295,10 +739,11 @@ class Plotter:
 
             for file, df in self.dataframes.items():
                 for (y_col, y_ax, label) in self.columns[file]:
+                    x = time_base(self.x_data_values[0], self.x_data_values[-1], len(df[y_col]))
                     if y_ax == 1:
-                        ax1.plot(np.linspace(self.x_data_values[0],self.x_data_values[-1],len(df[y_col])), df[y_col], color=ax1_color, alpha=1, label=label, lw=self.linewidth)  
+                        self._plot_line(ax1, sources, x, df[y_col], self.xlimits, key=(file, y_col), color=ax1_color, alpha=1, label=label, lw=self.linewidth)  
                     else:
-                        ax2.plot(np.linspace(self.x_data_values[0],self.x_data_values[-1],len(df[y_col])), df[y_col], color=ax2_color, alpha=1, linestyle = "--", label=label, lw=self.linewidth)
+                        self._plot_line(ax2, sources, x, df[y_col], self.xlimits, key=(file, y_col), color=ax2_color, alpha=1, linestyle = "--", label=label, lw=self.linewidth)
 
 
             # set axis colors
@@ -309,193 +754,395 @@ class Plotter:
             ax2.yaxis.label.set_color(ax2_color)
             ax2.spines['right'].set_color(ax2_color)
             ax2.tick_params(axis='y', colors=ax2_color)
-            if self.title:
-                if self.title_fontsize is False:
-                    ax1.set_title(self.title)
-                else:
-                    ax1.set_title(self.title, fontsize=self.title_fontsize)
-            if self.label_fontsize is False:
-                ax1.set_xlabel(self.xlabel)
-                ax1.set_ylabel(self.ylabel1)
-                ax2.set_ylabel(self.ylabel2)
-            else:
-                ax1.set_xlabel(self.xlabel, fontsize=self.label_fontsize)
-                ax1.set_ylabel(self.ylabel1, fontsize=self.label_fontsize)
-                ax2.set_ylabel(self.ylabel2, fontsize=self.label_fontsize)
-            if self.tick_fontsize is False:
-                ax1.tick_params(axis='x')  # Change x-axis tick label font size
-                ax1.tick_params(axis='y')  # Change y-axis tick label font size
-                ax2.tick_params(axis='y')  # Change y-axis tick label font size
-            else:
-                ax1.tick_params(axis='x', labelsize=self.tick_fontsize)  # Change x-axis tick label font size
-                ax1.tick_params(axis='y', labelsize=self.tick_fontsize)  # Change y-axis tick label font size
-                ax2.tick_params(axis='y', labelsize=self.tick_fontsize)  # Change y-axis tick label font size
-            if self.xlimits:
-                ax1.set_xlim(self.xlimits)
-            if self.ylimits1:
-                ax1.set_ylim(self.ylimits1)
-            if self.ylimits2:
-                ax2.set_ylim(self.ylimits2)
-
-            if self.legend:
-                # remove duplicate labels in legend
-                handles1, labels1 = ax1.get_legend_handles_labels()
-                handles2, labels2 = ax2.get_legend_handles_labels()
-                by_label1 = dict(zip(labels1, handles1))
-                by_label2 = dict(zip(labels2, handles2))
-                if self.legend_fontsize is False:
-                    ax1.legend(by_label1.values(), by_label1.keys(), loc ='upper left')
-                    ax2.legend(by_label2.values(), by_label2.keys(), loc ='lower right')
-                else:
-                    ax1.legend(by_label1.values(), by_label1.keys(), loc ='upper left', fontsize=self.legend_fontsize)
-                    ax2.legend(by_label2.values(), by_label2.keys(), loc ='lower right', fontsize=self.legend_fontsize)
             # ax1.grid()
 
-            self.save_data_plot()
-            # plt.show()
-
         elif self.plot_type == 'single_axis':
             if not self.figsize:
                 self.figsize = (10, 6)
-            plt.figure(figsize=self.figsize)
+            fig = new_figure(self.figsize, headless, self.plotstyle, getattr(self, 'fast_text', False))
+            ax = fig.subplots()
 
             color_counter = 0
+            batch = [] # (x, y, color, label) of series drawn together as one LineCollection
             for file, df in self.dataframes.items():
                 for (y_col, label) in self.columns[file]:
-                    plt.plot(np.linspace(self.x_data_values[0],self.x_data_values[-1],len(df[y_col])), df[y_col], color=colors[color_counter % len(colors)], alpha=1, label=label, lw=self.linewidth)
+                    x = time_base(self.x_data_values[0], self.x_data_values[-1], len(df[y_col]))
+                    if getattr(self, 'batch_lines', False):
+                        batch.append((x, df[y_col], colors[color_counter % len(colors)], label, (file, y_col)))
+                    else:
+                        self._plot_line(ax, sources, x, df[y_col], self.xlimits, key=(file, y_col), color=colors[color_counter % len(colors)], alpha=1, label=label, lw=self.linewidth)
                     color_counter += 1
-
-            if self.title:
-                if self.title_fontsize is False:
-                    plt.title(self.title)
-                else:
-                    plt.title(self.title, fontsize=self.title_fontsize)
-            if self.label_fontsize is False:
-                plt.xlabel(self.xlabel)
-                plt.ylabel(self.ylabel1)
-            else:
-                plt.xlabel(self.xlabel, fontsize=self.label_fontsize)
-                plt.ylabel(self.ylabel1, fontsize=self.label_fontsize)
-            if self.tick_fontsize is False:
-                plt.tick_params(axis='x')  # Change x-axis tick label font size
-                plt.tick_params(axis='y')  # Change y-axis tick label font size
-            else:
-                plt.tick_params(axis='x', labelsize=self.tick_fontsize)  # Change x-axis tick label font size
-                plt.tick_params(axis='y', labelsize=self.tick_fontsize)  # Change y-axis tick label font size
-            if self.xlimits:
-                plt.xlim(self.xlimits)
-            if self.ylimits1:
-                plt.ylim(self.ylimits1)
-            if self.legend:
-                # remove duplicate labels in legend
-                handles, labels = plt.gca().get_legend_handles_labels()
-                by_label = dict(zip(labels, handles))
-                if self.legend_fontsize is False:
-                    plt.legend(by_label.values(), by_label.keys(), loc = 'lower right')
-                else:
-                    plt.legend(by_label.values(), by_label.keys(), fontsize=self.legend_fontsize)
+            self._plot_batch(ax, sources, batch, self.xlimits)
             # plt.grid()
 
-            self.save_data_plot()
-            # plt.show()
+        elif self.plot_type == 'stacked':
+            # One row per label, all sharing the x axis; within a panel each file gets a color
+            panels = {}
+            for file_counter, (file, df) in enumerate(self.dataframes.items()):
+                for (y_col, label) in self.columns[file]:
+                    panels.setdefault(label, []).append((file_counter, file, y_col, df[y_col]))
+            # No figsize, or no height (figsize=(w, False)): STACKED_PANEL_HEIGHT per panel
+            height = max(6, STACKED_PANEL_HEIGHT * len(panels))
+            if not self.figsize:
+                self.figsize = (10, height)
+            elif not self.figsize[1]:
+                self.figsize = (self.figsize[0], height)
+            fig = new_figure(self.figsize, headless, self.plotstyle, getattr(self, 'fast_text', False))
+            axes = fig.subplots(len(panels), 1, sharex=True, squeeze=False)[:, 0]
+            fig.subplots_adjust(hspace=0.1)
+
+            for ax, (label, series) in zip(axes, panels.items()):
+                batch = []
+                for file_counter, file, y_col, y in series:
+                    x = time_base(self.x_data_values[0], self.x_data_values[-1], len(y))
+                    if getattr(self, 'batch_lines', False):
+                        batch.append((x, y, colors[file_counter % len(colors)], file, (file, y_col)))
+                    else:
+                        self._plot_line(ax, sources, x, y, self.xlimits, key=(file, y_col), color=colors[file_counter % len(colors)], alpha=1, label=file, lw=self.linewidth)
+                self._plot_batch(ax, sources, batch, self.xlimits)
+                ax.set_ylabel(label)
 
         elif self.plot_type == 'bode':
             if not self.figsize:
                 self.figsize = (10, 6)
-            plt.figure(figsize=self.figsize)
+            fig = new_figure(self.figsize, headless, self.plotstyle, getattr(self, 'fast_text', False))
+            ax_magnitude = fig.add_subplot(2, 1, 1, label = "bode_magnitude")
+            ax_phase = fig.add_subplot(2, 1, 2, label = "bode_phase")
+            freq_window = self.xlimits if self.xlimits else (self.start_freq, self.end_freq)
 
             color_counter = 0
             for file, df in self.dataframes.items():
                 for (y_col, label) in self.columns[file]:
 
-                    # Subtract mean to remove DC component and skip samples if specified
-                    input_signal = self.x_data_values - np.mean(self.x_data_values)
-
-                    # Create frequency array
-                    n = len(input_signal)
-                    d = 1 / self.sampling_rate  # Sampling interval
-                    freq = np.fft.rfftfreq(n, d) # Frequency bins
-
-                    # Resample output if necessary to match lengths
-                    if n != len(df[y_col]):
-                        # Interpolate to match lengths
-                        f_interp = interp1d(np.linspace(0, 1, len(df[y_col])), df[y_col], kind='linear', fill_value="extrapolate")
-                        output_resampled = f_interp(np.linspace(0, 1, n))
-                        output_signal = output_resampled - np.mean(output_resampled)
-                    else:
-                        output_signal = df[y_col] - np.mean(df[y_col])
-
-                    # Compute FFTs
-                    input_fft = np.fft.rfft(input_signal)
-                    output_fft = np.fft.rfft(output_signal)
-                    H = output_fft / input_fft
-
-                    # Smooth H
-                    window_size = 7  # Must be odd
-                    H_magnitude = np.abs(H)
-                    H_phase = np.angle(H)
-                    H_magnitude_smooth = np.convolve(H_magnitude, np.ones(window_size)/window_size, mode='same')
-                    H_phase_smooth = np.convolve(H_phase, np.ones(window_size)/window_size, mode='same')
-                    H = H_magnitude_smooth * np.exp(1j * H_phase_smooth)
-                    print(f"Smoothing FFT data with moving average, window size = {window_size}")
-
-                    # Compute magnitude and phase
-                    # magnitude = 20 * np.log10(np.abs(H))
-                    magnitude = np.abs(H)
-                    phase = np.angle(H, deg=True)
-
+                    # Transfer function from the input signal (_bode_response), reused from the render cache
+                    freq, magnitude, phase = self._cached(('bode', file, y_col, self.sampling_rate),
+                                                          lambda: self._bode_response(df[y_col]))
 
                     # Plot Bode plots
-                    plt.subplot(2, 1, 1, label = "bode_magnitude")
-                    # plt.semilogx(freq, magnitude, color=colors[color_counter], alpha=1, label=label)
-                    plt.plot(freq, magnitude, color=colors[color_counter], alpha=1, label=label, lw=self.linewidth)
-                    plt.ylabel('Magnitude (abs)')
-                    plt.grid(which='both', axis='both')
-                    if self.ylimits1:
-                        plt.ylim(self.ylimits1)
-                    plt.xlim(self.xlimits if self.xlimits else (self.start_freq, self.end_freq))
-
-                    plt.subplot(2, 1, 2, label = "bode_phase")
-                    # plt.semilogx(freq, phase, color=colors[color_counter], alpha=1, label=label)
-                    plt.plot(freq, phase, color=colors[color_counter], alpha=1, label=label, lw=self.linewidth)
-                    plt.xlabel('Frequency (Hz)')
-                    plt.ylabel('Phase (deg)')
-                    plt.grid(which='both', axis='both')
-                    if self.ylimits2:
-                        plt.ylim(self.ylimits2)
-                    plt.xlim(self.xlimits if self.xlimits else (self.start_freq, self.end_freq))
+                    # ax_magnitude.semilogx(freq, magnitude, color=colors[color_counter], alpha=1, label=label)
+                    self._plot_line(ax_magnitude, sources, freq, magnitude, freq_window, key=(file, y_col, 'magnitude'), color=colors[color_counter], alpha=1, label=label, lw=self.linewidth)
+                    ax_magnitude.set_ylabel('Magnitude (abs)')
+                    ax_magnitude.grid(which='both', axis='both')
+                    ax_magnitude.set_xlim(freq_window)
+
+                    # ax_phase.semilogx(freq, phase, color=colors[color_counter], alpha=1, label=label)
+                    self._plot_line(ax_phase, sources, freq, phase, freq_window, key=(file, y_col, 'phase'), color=colors[color_counter], alpha=1, label=label, lw=self.linewidth)
+                    ax_phase.set_xlabel('Frequency (Hz)')
+                    ax_phase.set_ylabel('Phase (deg)')
+                    ax_phase.grid(which='both', axis='both')
+                    ax_phase.set_xlim(freq_window)
 
                     color_counter += 1
-
-            if self.title:
-                if self.title_fontsize is False:
-                    plt.title(self.title)
-                else:
-                    plt.title(self.title, fontsize=self.title_fontsize)
-            if self.tick_fontsize is False:
-                plt.tick_params(axis='x')  # Change x-axis tick label font size
-                plt.tick_params(axis='y')  # Change y-axis tick label font size
-            else:
-                plt.tick_params(axis='x', labelsize=self.tick_fontsize)  # Change x-axis tick label font size
-                plt.tick_params(axis='y', labelsize=self.tick_fontsize)  # Change y-axis tick label font size
-            if self.legend:
-                # remove duplicate labels in legend
-                handles, labels = plt.gca().get_legend_handles_labels()
-                by_label = dict(zip(labels, handles))
-                if self.legend_fontsize is False:
-                    plt.legend(by_label.values(), by_label.keys(), loc = 'lower right')
-                else:
-                    plt.legend(by_label.values(), by_label.keys(), fontsize=self.legend_fontsize)
             # plt.grid()
 
-            self.save_data_plot()
-            # plt.show()
+        elif self.plot_type == 'density':
+            if not self.figsize:
+                self.figsize = (10, 6)
+            fig = new_figure(self.figsize, headless, self.plotstyle, getattr(self, 'fast_text', False))
+            ax = fig.subplots()
+
+            # Histogram of every series in the x window (_density), reused from the render cache
+            xlimits = self._x_window()
+            nx = int(self.figsize[0] * DENSITY_DPI)
+            ny = int(self.figsize[1] * DENSITY_DPI)
+            members = tuple((file, y_col) for file in self.dataframes for (y_col, label) in self.columns[file])
+            ylimits, density, column_means = self._cached(('density', members, xlimits, tuple(self.ylimits1) if self.ylimits1 else None, nx, ny),
+                                                          lambda: self._density(xlimits, nx, ny))
+
+            image = ax.imshow(density, origin='lower', extent=(*xlimits, *ylimits), aspect='auto',
+                              cmap=DENSITY_CMAP, interpolation='nearest')
+            fig.colorbar(image, ax=ax, label='Fraction of samples')
+
+            # Mean / percentile lines across series, one point per time column
+            centers = xlimits[0] + (np.arange(nx) + 0.5) * (xlimits[1] - xlimits[0]) / nx
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning) # columns no series reaches
+                if getattr(self, 'density_mean', True):
+                    ax.plot(centers, np.nanmean(column_means, axis=0), color='white', alpha=1, label='Mean', lw=self.linewidth)
+                for p in getattr(self, 'density_percentiles', (5, 95)):
+                    ax.plot(centers, np.nanpercentile(column_means, p, axis=0), color='white', alpha=1, linestyle='--', label=f'{p:g}th percentile', lw=self.linewidth / 2)
+
+
+        elif self.plot_type == 'trial_stats':
+            if not self.figsize:
+                self.figsize = (10, 6)
+            fig = new_figure(self.figsize, headless, self.plotstyle, getattr(self, 'fast_text', False))
+            ax = fig.subplots()
+
+            # Series sharing a label (the same signal over many trials) form one group
+            groups = {}
+            for file, df in self.dataframes.items():
+                for (y_col, label) in self.columns[file]:
+                    groups.setdefault(label, []).append((file, y_col))
+            xlimits = self._x_window()
+            percentiles = tuple(getattr(self, 'stats_percentiles', (5, 95)))
+
+            for color_counter, (label, members) in enumerate(groups.items()):
+                color = colors[color_counter % len(colors)]
+                # statistics of the group (_trial_stats), reused from the render cache
+                grid, mean, std, band = self._cached(('trial_stats', tuple(members), xlimits, self.figsize[0], percentiles),
+                                                     lambda: self._trial_stats(members, xlimits, percentiles))
+                if getattr(self, 'stats_std', True):
+                    ax.fill_between(grid, mean - std, mean + std, color=color, alpha=0.3, lw=0, label=f'{label} ± 1 std')
+                if band is not None:
+                    ax.fill_between(grid, band[0], band[1], color=color, alpha=0.15, lw=0,
+                                    label=f'{label} {min(percentiles):g}-{max(percentiles):g}th percentile')
+                ax.plot(grid, mean, color=color, alpha=1, label=f'{label} (mean of {len(members)})', lw=self.linewidth)
+
 
         else:
             print("Error with plot type.")
+            return None
 
-    def save_data_plot(self):
+        self._apply_style(fig)
+        if not headless:
+            self._redecimate_on_zoom(sources)
+            self.save_data_plot(fig)
+            # plt.show()
+        return fig
+
+    def _apply_style(self, fig):
+        # Applies title, axis labels, y limits, font sizes and legend to the axes plot_data drew.
+        # Can be re-run on the same figure (restyle), so unset (False) font sizes are passed
+        # as the style's defaults and unset limits switch autoscaling back on
+        rc = plt.rcParams
+        title_fs = rc['axes.titlesize'] if self.title_fontsize is False else self.title_fontsize
+        label_fs = rc['axes.labelsize'] if self.label_fontsize is False else self.label_fontsize
+        legend_fs = rc['legend.fontsize'] if self.legend_fontsize is False else self.legend_fontsize
+        # the single axis and bode legends go to 'best' when a legend font size is given
+        legend_loc = 'lower right' if self.legend_fontsize is False else 'best'
+
+        axes = fig.axes
+        if self.plot_type == 'twin_axes':
+            title_ax = axes[0]
+            y_axes = [(axes[0], self.ylabel1, self.ylimits1), (axes[1], self.ylabel2, self.ylimits2)]
+            tick_axes = axes[:2]
+            legends = [(axes[0], 'upper left'), (axes[1], 'lower right')]
+        elif self.plot_type == 'bode':
+            # axis labels are fixed; title, tick sizes and legend go on the phase (bottom) axes
+            title_ax = axes[1]
+            y_axes = [(axes[0], None, self.ylimits1), (axes[1], None, self.ylimits2)]
+            tick_axes = axes[1:2]
+            legends = [(axes[1], legend_loc)]
+        elif self.plot_type == 'stacked':
+            # panel labels are set by plot_data; the shared y label goes beside all panels
+            title_ax = axes[0]
+            y_axes = [(ax, ax.get_ylabel(), self.ylimits1) for ax in axes]
+            tick_axes = axes
+            legends = [(axes[0], legend_loc)]
+            fig.supylabel(self.ylabel1 or '', fontsize=label_fs)
+        else: # single_axis, density, trial_stats (density adds a colorbar axes)
+            title_ax = axes[0]
+            y_axes = [(axes[0], self.ylabel1, self.ylimits1)]
+            tick_axes = axes[:1]
+            legends = [(axes[0], legend_loc if self.plot_type == 'single_axis' else 'lower right')]
+
+        title_ax.set_title(self.title or '', fontsize=title_fs)
+        if self.plot_type != 'bode':
+            axes[-1 if self.plot_type == 'stacked' else 0].set_xlabel(self.xlabel, fontsize=label_fs)
+        for ax, ylabel, ylimits in y_axes:
+            if ylabel is not None:
+                ax.set_ylabel(ylabel, fontsize=label_fs)
+            if ylimits:
+                ax.set_ylim(ylimits)
+            else:
+                ax.set_autoscaley_on(True)
+                ax.autoscale_view(scalex=False)
+        for ax in tick_axes:
+            ax.tick_params(axis='x', labelsize=rc['xtick.labelsize'] if self.tick_fontsize is False else self.tick_fontsize)  # Change x-axis tick label font size
+            ax.tick_params(axis='y', labelsize=rc['ytick.labelsize'] if self.tick_fontsize is False else self.tick_fontsize)  # Change y-axis tick label font size
+        if self.plot_type in ('density', 'trial_stats'):
+            axes[0].set_xlim(self._x_window())
+        elif self.plot_type != 'bode' and self.xlimits:
+            axes[0].set_xlim(self.xlimits)
+
+        for ax, loc in legends:
+            if ax.get_legend():
+                ax.get_legend().remove()
+            # remove duplicate labels in legend
+            handles, labels = ax.get_legend_handles_labels()
+            by_label = dict(zip(labels, handles))
+            if self.legend and by_label:
+                ax.legend(by_label.values(), by_label.keys(), loc=loc, fontsize=legend_fs)
+
+    def restyle(self, fig, drawn_linewidth):
+        # Re-applies style-only settings (title, axis labels, y limits, font sizes,
+        # line width, legend, figure size) to a figure plot_data drew with the same
+        # data_key, without re-plotting. drawn_linewidth: line width the figure has now
+        with self.style_context():
+            self._restyle(fig, drawn_linewidth)
+
+    def _restyle(self, fig, drawn_linewidth):
+        if self.figsize:
+            width, height = self.figsize
+            fig.set_size_inches((width, height or fig.get_figheight()), forward=True) # no height: stacked panels keep their auto height
+        if drawn_linewidth and self.linewidth != drawn_linewidth:
+            scale = self.linewidth / drawn_linewidth
+            for ax in fig.axes:
+                for line in ax.lines:
+                    line.set_linewidth(line.get_linewidth() * scale)
+                for collection in ax.collections:
+                    if isinstance(collection, LineCollection):
+                        collection.set_linewidth(collection.get_linewidth() * scale)
+        self._apply_style(fig)
+        fig.canvas.draw_idle()
+
+    def data_key(self):
+        # Settings that change what plot_data draws (anything else is applied by restyle).
+        # Tables are compared by identity, so reloaded data counts as a change. The key
+        # holds the tables themselves (not their id()), so a freed table's id can't be
+        # reused by a newly loaded one while the key is kept
+        return (self.plot_type, self.plotstyle, getattr(self, 'fast_text', False),
+                getattr(self, 'x_file', None), self.x_data, repr(self.columns),
+                tuple(self.dataframes.items()),
+                tuple(self.figsize) if self.figsize else None, # decimation buckets, density image and grids follow the size
+                self.xlimits, self.ylimits1 if self.plot_type == 'density' else None,
+                getattr(self, 'decimate', True), getattr(self, 'batch_lines', False),
+                getattr(self, 'start_freq', None), getattr(self, 'end_freq', None), getattr(self, 'sampling_rate', None),
+                getattr(self, 'density_mean', True), tuple(getattr(self, 'density_percentiles', (5, 95))),
+                getattr(self, 'stats_std', True), tuple(getattr(self, 'stats_percentiles', (5, 95))))
+
+    def _cropped(self, file, y_col):
+        # Returns (x, y) of one single axis series, cropped to xlimits
+        y = np.asarray(self.dataframes[file][y_col], dtype=float)
+        x = time_base(self.x_data_values[0], self.x_data_values[-1], len(y))
+        return crop_to_xlimits(x, y, self.xlimits)
+
+    def _density(self, xlimits, nx, ny):
+        # Returns the y range, density image and per-series column means of the density plot
+        # Crop every series to the x window first, then bin
+        series = [self._cropped(file, y_col) for file in self.dataframes for (y_col, label) in self.columns[file]]
+        if self.ylimits1:
+            ylimits = tuple(self.ylimits1)
+        else:
+            ylimits = (min(np.nanmin(y) for x, y in series), max(np.nanmax(y) for x, y in series))
+            if ylimits[0] == ylimits[1]: # flat data
+                ylimits = (ylimits[0] - 0.5, ylimits[1] + 0.5)
+        return (ylimits, *density_histogram(series, xlimits, ylimits, nx, ny))
+
+    def _trial_stats(self, members, xlimits, percentiles):
+        # Returns the grid, mean, std and percentile band (None without two percentiles)
+        # of the (file, y_col) series in members
+        series = [self._cropped(file, y_col) for file, y_col in members]
+        # one grid point per pixel column (or per sample, if fewer)
+        n = min(max(len(x) for x, y in series), int(self.figsize[0] * DECIMATE_DPI))
+        grid, stack = resample_trials(series, xlimits, n)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning) # grid points no trial reaches
+            mean = np.nanmean(stack, axis=0)
+            std = np.nanstd(stack, axis=0)
+            band = np.nanpercentile(stack, sorted(percentiles), axis=0) if len(percentiles) == 2 else None
+        return grid, mean, std, band
+
+    def _x_window(self):
+        # x range shown by the density and trial_stats plots
+        if self.xlimits:
+            return tuple(self.xlimits)
+        return (float(self.x_data_values[0]), float(self.x_data_values[-1]))
+
+    def _decimated(self, x, y):
+        # Returns the points of a series to draw: min/max per pixel column of the
+        # saved figure (see minmax_decimate), or everything if decimation is off
+        if not getattr(self, 'decimate', True):
+            return x, y
+        return minmax_decimate(x, y, int(self.figsize[0] * DECIMATE_DPI))
+
+    def _draw_points(self, x, y, xlimits, key=None):
+        # Returns the series cropped to xlimits and decimated. With a key (the series'
+        # source, e.g. (file, y_col)) decimated points are kept in the render cache;
+        # undecimated ones are views of the data and are not
+        if key is None or not getattr(self, 'decimate', True):
+            return self._decimated(*crop_to_xlimits(x, y, xlimits))
+        return self._cached(('points', *key, getattr(self, 'sampling_rate', None), tuple(xlimits) if xlimits else None, self.figsize[0]),
+                            lambda: self._decimated(*crop_to_xlimits(x, y, xlimits)))
+
+    def _cached(self, key, compute):
+        # Returns the render cache entry for key (prefixed with the x / input column
+        # everything drawn depends on), calling compute() to fill it on a miss
+        cache = self.__dict__.setdefault('_render_cache', {}) # pickles from before the cache have none
+        key = (getattr(self, 'x_file', None), self.x_data, *key)
+        self.__dict__.setdefault('_render_used', set()).add(key)
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
+    def _plot_line(self, ax, sources, x, y, xlimits, key=None, **kwargs):
+        # Plots the series on ax, cropped to xlimits and decimated, and records its
+        # full-resolution data in sources for re-decimation on zoom
+        x = np.asarray(x)
+        y = np.asarray(y)
+        line, = ax.plot(*self._draw_points(x, y, xlimits, key), **kwargs)
+        sources.append((line, x, y))
+        return line
+
+    def _plot_batch(self, ax, sources, series, xlimits):
+        # Draws all series as a single LineCollection with per-segment colors, so
+        # hundreds of trials cost one artist instead of one Line2D each. The legend
+        # gets one empty proxy line per label, since the collection has no per-series labels
+        if not series:
+            return
+        xs = [np.asarray(x) for x, _, _, _, _ in series]
+        ys = [np.asarray(y) for _, y, _, _, _ in series]
+        segments = [np.column_stack(self._draw_points(x, y, xlimits, key)) for x, y, (_, _, _, _, key) in zip(xs, ys, series)]
+        collection = LineCollection(segments, colors=[color for _, _, color, _, _ in series], linewidths=self.linewidth)
+        ax.add_collection(collection)
+        ax.autoscale_view()
+        sources.append((collection, xs, ys))
+
+        proxies = {}
+        for _, _, color, label, _ in series:
+            proxies.setdefault(label, color)
+        for label, color in proxies.items():
+            ax.plot([], [], color=color, lw=self.linewidth, label=label)
+
+    def _bode_response(self, y):
+        # Returns the frequency bins and the smoothed magnitude and phase of y / input signal
+        # Subtract mean to remove DC component and skip samples if specified
+        input_signal = self.x_data_values - np.mean(self.x_data_values)
+
+        # Create frequency array
+        n = len(input_signal)
+        d = 1 / self.sampling_rate  # Sampling interval
+        freq = np.fft.rfftfreq(n, d) # Frequency bins
+
+        # Resample output if necessary to match lengths
+        if n != len(y):
+            # Interpolate to match lengths
+            f_interp = interp1d(time_base(0, 1, len(y)), y, kind='linear', fill_value="extrapolate")
+            output_resampled = f_interp(time_base(0, 1, n))
+            output_signal = output_resampled - np.mean(output_resampled)
+        else:
+            output_signal = y - np.mean(y)
+
+        # Compute FFTs
+        input_fft = np.fft.rfft(input_signal)
+        output_fft = np.fft.rfft(output_signal)
+        H = output_fft / input_fft
+
+        # Smooth H
+        window_size = 7  # Must be odd
+        H_magnitude = np.abs(H)
+        H_phase = np.angle(H)
+        H_magnitude_smooth = np.convolve(H_magnitude, np.ones(window_size)/window_size, mode='same')
+        H_phase_smooth = np.convolve(H_phase, np.ones(window_size)/window_size, mode='same')
+        H = H_magnitude_smooth * np.exp(1j * H_phase_smooth)
+        print(f"Smoothing FFT data with moving average, window size = {window_size}")
+
+        # Compute magnitude and phase
+        # magnitude = 20 * np.log10(np.abs(H))
+        magnitude = np.abs(H)
+        phase = np.angle(H, deg=True)
+        return freq, magnitude, phase
+
+    def _redecimate_on_zoom(self, sources):
+        # Restores full detail for the visible window when the interactive plot is zoomed
+        if getattr(self, 'decimate', True):
+            redecimate_on_zoom(sources, int(self.figsize[0] * DECIMATE_DPI))
+
+    def save_data_plot(self, fig=None):
         # Asks user if they want to save the data used for plotting to a pickle file AND/OR save the plot as an image file.
+        if fig is None:
+            fig = plt.gcf()
         save_data = input("Do you want to pickle the settings to easily plot later? (y/n): ")
         if save_data.lower() == 'y':
             # check if there is a folder called "Pickles" in the given folder, if not create it
@@ -514,41 +1161,14 @@ class Plotter:
                 os.makedirs(self.foldername + '\\Plots')
             plot_name = input("Enter name for figure (or hit enter to save as title of plot): ")
             if plot_name:
-                plt.savefig(self.foldername + '\\Plots\\' + plot_name + '.png',bbox_inches='tight',dpi=300)
+                fig.savefig(self.foldername + '\\Plots\\' + plot_name + '.png',bbox_inches='tight',dpi=300)
                 print(f"Plot saved to {self.foldername} as {plot_name+ '.png'}")
             else:
-                plt.savefig(self.foldername + '\\Plots\\' + self.title + '.png',bbox_inches='tight',dpi=300)
+                fig.savefig(self.foldername + '\\Plots\\' + self.title + '.png',bbox_inches='tight',dpi=300)
                 print(f"Plot saved to {self.foldername} as {self.title + '.png'}")
 
-    def mat_struct_to_dataframe(self, path: str, file: str) -> pd.DataFrame:
+    def mat_struct_to_dataframe(self, path: str, file: str):
         #  Load a .mat file containing a struct and convert its double vector fields
-        # into a DataFrame. Non-double fields (nested structs, etc.) are ignored
-
-        mat = loadmat(os.path.join(path, file), squeeze_me=True)
-
-        columns = {}
-        for key, value in mat.items():
-            # skip MATLAB metadata keys
-            if key.startswith("__"):
-                continue
-
-            # keep only numpy arrays with a floating-point dtype
-            if not isinstance(value, np.ndarray):
-                continue
-            if not np.issubdtype(value.dtype, np.floating):
-                continue
-
-            columns[key] = value.flatten()
-
-        if not columns:
-            raise ValueError("No double vector fields found in the .mat file.")
-
-        lengths = {name: arr.size for name, arr in columns.items()}
-        unique_lengths = set(lengths.values())
-        if len(unique_lengths) > 1:
-            raise ValueError(
-                f"Double fields have mismatched lengths: {lengths}. "
-                "Cannot build a rectangular DataFrame."
-            )
-
-        return pd.DataFrame(columns)
\ No newline at end of file
+        # into a DataFrame. Non-double fields (nested structs, etc.) are ignored.
+        # Fields of different lengths are returned as a ColumnTable (ragged columns)
+        return mat_struct_to_dataframe(path, file)
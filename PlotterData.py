@@ -0,0 +1,744 @@
+######################################
+# PLOTTER DATA #######################
+# BY: ALEXANDER HEDRICK ##############
+######################################
+
+# Data loading helpers shared by PlotterClass and PlotterGUI.
+# Every loader returns one ColumnTable per data file; tables are stored in a
+# {filename: table} dict which is what Plotter.dataframes holds.
+
+import os
+import json
+import re
+import hashlib
+import threading
+from functools import partial
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from scipy.io import loadmat, whosmat
+try:
+    import h5py   # only needed for MATLAB v7.3 (HDF5) .mat files
+except ImportError:
+    h5py = None
+try:
+    import openpyxl   # .xlsx files
+except ImportError:
+    openpyxl = None
+
+DATA_EXTENSIONS = ('.xlsx', '.csv', '.mat')
+CACHE_DIRNAME = '.plotter_cache'   # created next to the data files
+STORAGE_MODES = ('memory', 'memmap', 'stream')
+ENVELOPE_BUCKETS = 4096            # min/max buckets per column for storage='stream'
+STREAM_CHUNKSIZE = 200_000         # CSV rows parsed per chunk for storage='stream'
+
+
+class ColumnTable:
+    """Lightweight column table used for Plotter.dataframes instead of a
+    pandas DataFrame: a dict of contiguous 1-D numpy arrays with the subset
+    of the DataFrame interface the plotter uses (.columns, [name], len() and
+    head()). df[col] returns the stored array itself, no copy or Series.
+
+    Columns may have different lengths (e.g. channels of a .mat file
+    recorded at different rates); plot_data gives every series its own time
+    base over the shared time span, so ragged columns need no padding."""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = {name: np.ascontiguousarray(values) for name, values in data.items()}
+
+    @classmethod
+    def from_frame(cls, df):
+        """Wrap the columns of a parsed DataFrame (no copy for numeric columns)."""
+        return cls({c: df[c].to_numpy() for c in df.columns})
+
+    @property
+    def columns(self):
+        return list(self._data)
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __len__(self):
+        return max((len(v) for v in self._data.values()), default=0)
+
+    def head(self, n=5):
+        return pd.DataFrame({c: pd.Series(np.asarray(self[c][:n])) for c in self.columns})
+
+
+class LazyColumns(ColumnTable):
+    """Read-only ColumnTable whose columns are produced on first access.
+
+    loaders maps column name -> zero-argument callable returning a 1-D array
+    (e.g. np.load(..., mmap_mode='r')), so only the columns (and pages) that
+    are actually used get read. Pickling stores the column values, so pickles
+    do not depend on the cache folder."""
+
+    __slots__ = ('_loaders',)
+
+    def __init__(self, loaders):
+        self._loaders = dict(loaders)
+        self._data = {}
+
+    @property
+    def columns(self):
+        return list(self._loaders)
+
+    def __getitem__(self, name):
+        if name not in self._data:
+            self._data[name] = self._loaders[name]()
+        return self._data[name]
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def __len__(self):
+        # first column only, so len() doesn't read every channel
+        return len(self[self.columns[0]]) if self._loaders else 0
+
+    def __getstate__(self):
+        return {c: np.array(self[c]) for c in self.columns}
+
+    def __setstate__(self, state):
+        self._data = state
+        self._loaders = dict.fromkeys(state)
+
+
+def mat_struct_to_dataframe(path: str, file: str, columns=None) -> ColumnTable:
+    """Load a .mat file containing a struct and convert its double vector fields
+    into a ColumnTable. Non-double fields (nested structs, etc.) are ignored.
+    If columns is given only those variables are read from the file."""
+    variable_names = list(columns) if columns is not None else None
+    mat = loadmat(os.path.join(path, file), squeeze_me=True,
+                  variable_names=variable_names)
+
+    columns = {}
+    for key, value in mat.items():
+        # skip MATLAB metadata keys
+        if key.startswith("__"):
+            continue
+
+        # keep only numpy arrays with a floating-point dtype
+        if not isinstance(value, np.ndarray):
+            continue
+        if not np.issubdtype(value.dtype, np.floating):
+            continue
+
+        columns[key] = value.flatten()
+
+    if not columns:
+        raise ValueError("No double vector fields found in the .mat file.")
+
+    # fields recorded at different rates keep their own lengths
+    return ColumnTable(columns)
+
+
+# -- XLSX workbooks -------------------------------------------------------------
+# A workbook's first sheet is loaded under the plain file name; other sheets
+# are loaded under the key "file.xlsx[Sheet name]" (Excel doesn't allow [ or ]
+# in sheet names). Sheets are read with openpyxl in read-only mode, which
+# streams the rows instead of building the whole workbook, and only numeric
+# columns are kept.
+
+_SHEET_KEY = re.compile(r'^(.+\.xlsx)\[(.+)\]$')
+
+
+def sheet_key(file: str, sheet: str) -> str:
+    """Key used in Plotter.dataframes for one sheet of a workbook."""
+    return f"{file}[{sheet}]"
+
+
+def split_sheet_key(key: str):
+    """Return (file, sheet) for a sheet key, (key, None) for a plain file name."""
+    m = _SHEET_KEY.match(key)
+    return (m.group(1), m.group(2)) if m else (key, None)
+
+
+def _require_openpyxl():
+    if openpyxl is None:
+        raise ImportError("Reading .xlsx files requires openpyxl (pip install openpyxl).")
+
+
+def list_sheets(path: str, file: str) -> list:
+    """Sheet names of a workbook, without reading any cells."""
+    _require_openpyxl()
+    wb = openpyxl.load_workbook(os.path.join(path, file), read_only=True)
+    try:
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+
+def _xlsx_header(row) -> list:
+    # Column names as pandas would name them (blank header -> "Unnamed: i")
+    return [f"Unnamed: {i}" if h is None else str(h) for i, h in enumerate(row)]
+
+
+def read_xlsx(path: str, file: str, sheet=None, columns=None, header_only=False):
+    """Read one sheet (the first by default) of a workbook into a ColumnTable.
+    Only the numeric columns are kept; blank cells become NaN. A column named
+    in `columns` that is not numeric raises a ValueError. With
+    header_only=True just the column names are returned."""
+    _require_openpyxl()
+    wb = openpyxl.load_workbook(os.path.join(path, file), read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet is not None else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        names = _xlsx_header(next(rows, ()))
+        if header_only:
+            return names
+
+        wanted = set(names if columns is None else columns)
+        idx = [i for i, c in enumerate(names) if c in wanted]
+        if not idx:
+            return ColumnTable({})
+        get = itemgetter(*idx) if len(idx) > 1 else (lambda r: (r[idx[0]],))
+        # read-only mode doesn't pad rows when the sheet's <dimension> is missing or
+        # wrong, so short rows are padded with None (NaN) to keep samples aligned
+        values = [get(r) if len(r) > idx[-1] else tuple(r[i] if i < len(r) else None for i in idx)
+                  for r in rows]
+    finally:
+        wb.close()
+
+    # read-only sheets can report empty rows past the data
+    while values and all(v is None for v in values[-1]):
+        values.pop()
+    cells = np.array(values, dtype=object).reshape(len(values), len(idx))
+
+    data = {}
+    for j, i in enumerate(idx):
+        try:
+            data[names[i]] = cells[:, j].astype(float)
+        except (TypeError, ValueError):
+            if columns is not None:   # picked by the user -- say why it can't be plotted
+                raise ValueError(f"Column '{names[i]}' in {file} is not numeric (text or dates) and can't be plotted.")
+            continue   # text / dates -- not plottable
+    return ColumnTable(data)
+
+
+# -- Column cache -------------------------------------------------------------
+# Each parsed file (or workbook sheet) is stored as one .npy file per numeric
+# column in <data folder>/.plotter_cache/<key>/, with a meta.json recording the source
+# file's size, mtime and content hash. An entry is reused while size and mtime
+# match; if only the mtime changed the content hash decides.
+# Column files are named by a hash of the column name, so writers adding
+# different columns to the same entry never share a file, and the meta.json
+# read-modify-write runs under a per-entry lock (the folder indexer and a
+# foreground load can write the same entry at once) and merges with the
+# meta.json on disk, for writers in other processes.
+
+_entry_locks = {}
+_entry_locks_guard = threading.Lock()
+
+
+def _cache_dir(path: str, file: str) -> str:
+    return os.path.join(path, CACHE_DIRNAME, file)
+
+
+def _entry_lock(cdir: str) -> threading.Lock:
+    with _entry_locks_guard:
+        return _entry_locks.setdefault(os.path.abspath(cdir), threading.Lock())
+
+
+def _column_filename(name) -> str:
+    return hashlib.blake2b(str(name).encode('utf-8'), digest_size=8).hexdigest() + '.npy'
+
+
+def _content_hash(full: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(full, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_meta(path: str, file: str):
+    """Return the cache meta dict for file if it is still valid, else None."""
+    meta_path = os.path.join(_cache_dir(path, file), 'meta.json')
+    full = os.path.join(path, split_sheet_key(file)[0])
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        st = os.stat(full)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('size') != st.st_size:
+        return None
+    if meta.get('mtime_ns') != st.st_mtime_ns:
+        # touched but possibly unchanged (copied, re-saved...) -- compare content
+        if meta.get('hash') != _content_hash(full):
+            return None
+        meta['mtime_ns'] = st.st_mtime_ns
+        _write_meta(path, file, meta)
+    return meta
+
+
+def _tmp_path(target: str) -> str:
+    # Per-writer temp name, so concurrent loads / the folder indexer never
+    # see (or clobber) each other's half-written files
+    return f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _write_meta(path: str, file: str, meta: dict):
+    meta_path = os.path.join(_cache_dir(path, file), 'meta.json')
+    tmp_path = _tmp_path(meta_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _cache_covers(meta, columns) -> bool:
+    # True if a valid cache entry holds the requested columns (None = all)
+    if meta is None:
+        return False
+    if columns is None:
+        return bool(meta.get('complete'))
+    return all(c in meta['columns'] for c in columns)
+
+
+def read_cache(path: str, file: str, columns=None):
+    """Return the cached table for file (only `columns` if given), or None
+    if the cache is missing, stale, or does not hold all requested columns."""
+    meta = _read_meta(path, file)
+    if not _cache_covers(meta, columns):
+        return None
+    cached = meta['columns']
+    wanted = set(meta['order'] if columns is None else columns)
+
+    cdir = _cache_dir(path, file)
+    # keep the file's column order, like usecols does when parsing
+    names = [c for c in meta['order'] if c in wanted]
+    try:
+        return ColumnTable({c: np.load(os.path.join(cdir, cached[c])) for c in names})
+    except OSError:
+        return None
+
+
+def write_cache(path: str, file: str, df, complete: bool):
+    """Store the numeric columns of df in the cache. complete marks that df
+    holds every column of the file. Columns already cached are kept."""
+    full = os.path.join(path, split_sheet_key(file)[0])
+    cdir = _cache_dir(path, file)
+    try:
+        os.makedirs(cdir, exist_ok=True)
+        with _entry_lock(cdir):
+            _write_cache_entry(path, file, full, cdir, df, complete)
+    except OSError:
+        pass   # read-only data folder etc. -- caching is best effort
+
+
+def _write_cache_entry(path, file, full, cdir, df, complete):
+    # write_cache body, run under the entry's lock
+    meta = _read_meta(path, file)
+    if meta is None:
+        st = os.stat(full)
+        meta = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                'hash': _content_hash(full), 'columns': {}, 'order': [],
+                'complete': False}
+
+    for name in df.columns:
+        values = np.asarray(df[name])
+        if values.dtype.kind not in 'biuf':
+            complete = False   # only numeric data is cached
+            continue
+        if name not in meta['columns']:
+            meta['columns'][name] = _column_filename(name)
+        npy_path = os.path.join(cdir, meta['columns'][name])
+        tmp_path = _tmp_path(npy_path)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, values)
+        os.replace(tmp_path, npy_path)
+    if complete or not meta['order']:
+        meta['order'] = [c for c in df.columns if c in meta['columns']]
+    else:
+        meta['order'] += [c for c in df.columns
+                          if c in meta['columns'] and c not in meta['order']]
+    meta['complete'] = meta['complete'] or complete
+
+    # merge columns another process (process pool loads) added meanwhile
+    on_disk = _read_meta(path, file)
+    if on_disk is not None and on_disk.get('hash') == meta['hash']:
+        for name, fname in on_disk['columns'].items():
+            meta['columns'].setdefault(name, fname)
+        meta['order'] += [c for c in on_disk['order'] if c not in meta['order']]
+        meta['complete'] = meta['complete'] or on_disk.get('complete', False)
+    _write_meta(path, file, meta)
+
+
+# -- Streaming envelopes --------------------------------------------------------
+class EnvelopeTable(ColumnTable):
+    """Per-bucket min/max/mean envelope of a CSV that was read in chunks.
+
+    table[col] is each bucket's min and max interleaved in time order, so it
+    plots over the recording's time span like the raw signal (2 points per
+    bucket). The bucket means are in table.mean[col]; table.n_rows is the
+    number of rows in the source file."""
+
+    __slots__ = ('mean', 'n_rows')
+
+    def __init__(self, mins, maxs, means, n_rows):
+        super().__init__({c: np.column_stack((mins[c], maxs[c])).ravel() for c in mins})
+        self.mean = means
+        self.n_rows = n_rows
+
+
+def _count_csv_rows(full: str) -> int:
+    # Number of data rows (lines after the header) without parsing the file
+    n_lines, last = 0, b'\n'
+    with open(full, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n_lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        n_lines += 1   # last line has no newline
+    return max(n_lines - 1, 0)
+
+
+def stream_csv_envelope(path: str, file: str, columns=None,
+                        n_buckets=ENVELOPE_BUCKETS, chunksize=STREAM_CHUNKSIZE) -> EnvelopeTable:
+    """Read a CSV in chunks of `chunksize` rows and reduce each column to
+    n_buckets min/max/mean buckets. Only the envelopes are kept in memory,
+    so files larger than RAM can be plotted."""
+    full = os.path.join(path, file)
+    n_rows = _count_csv_rows(full)
+    bucket_size = max(1, -(-n_rows // n_buckets))   # ceil
+    n_buckets = max(1, -(-n_rows // bucket_size))
+
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda c: c in wanted
+
+    mins, maxs, sums = {}, {}, {}
+    counts = np.zeros(n_buckets)
+    start = 0
+    for chunk in pd.read_csv(full, usecols=usecols, chunksize=chunksize):
+        if not mins:
+            for c in chunk.columns:
+                mins[c] = np.full(n_buckets, np.inf)
+                maxs[c] = np.full(n_buckets, -np.inf)
+                sums[c] = np.zeros(n_buckets)
+
+        bucket = np.arange(start, start + len(chunk)) // bucket_size
+        bucket = np.minimum(bucket, n_buckets - 1)   # row count was an estimate
+        seg_starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        seg_bucket = bucket[seg_starts]
+        counts[seg_bucket] += np.diff(np.r_[seg_starts, len(bucket)])
+        for c in mins:
+            v = chunk[c].to_numpy(dtype=float)
+            mins[c][seg_bucket] = np.fmin(mins[c][seg_bucket], np.fmin.reduceat(v, seg_starts))
+            maxs[c][seg_bucket] = np.fmax(maxs[c][seg_bucket], np.fmax.reduceat(v, seg_starts))
+            sums[c][seg_bucket] += np.add.reduceat(v, seg_starts)
+        start += len(chunk)
+
+    filled = counts > 0   # blank lines can leave trailing buckets empty
+    means = {c: sums[c][filled] / counts[filled] for c in sums}
+    return EnvelopeTable({c: v[filled] for c, v in mins.items()},
+                         {c: v[filled] for c, v in maxs.items()},
+                         means, start)
+
+
+def open_memmap_cache(path: str, file: str, columns=None):
+    """Return a LazyColumns table memory-mapping the cached .npy columns of
+    file, or None if the cache does not hold the requested columns."""
+    meta = _read_meta(path, file)
+    if not _cache_covers(meta, columns):
+        return None
+    cdir = _cache_dir(path, file)
+    wanted = set(meta['order'] if columns is None else columns)
+    return LazyColumns({c: partial(np.load, os.path.join(cdir, meta['columns'][c]), mmap_mode='r')
+                        for c in meta['order'] if c in wanted})
+
+
+# -- MATLAB v7.3 (HDF5) .mat files ---------------------------------------------
+# scipy's loadmat can't read v7.3 files. They are HDF5 files, so their double
+# variables (and the double fields of struct variables, named "struct.field")
+# are exposed as LazyColumns: a channel is read from disk only when it is
+# used, optionally only a range of samples.
+
+def is_mat73(full: str) -> bool:
+    """True if full is a MATLAB v7.3 (HDF5-based) .mat file."""
+    with open(full, 'rb') as f:
+        header = f.read(128)
+    return header.startswith(b'MATLAB 7.3') or header[:8] == b'\x89HDF\r\n\x1a\n'
+
+
+def _require_h5py():
+    if h5py is None:
+        raise ImportError("Reading MATLAB v7.3 .mat files requires h5py (pip install h5py).")
+
+
+def _mat73_vectors(full: str) -> list:
+    # Names of the double/single datasets, top-level or one struct level deep
+    def is_vector(node):
+        cls = node.attrs.get('MATLAB_class', b'')
+        cls = cls.decode() if isinstance(cls, bytes) else str(cls)
+        return (isinstance(node, h5py.Dataset) and cls in ('double', 'single')
+                and 'MATLAB_empty' not in node.attrs)
+
+    names = []
+    with h5py.File(full, 'r') as f:
+        for key, node in f.items():
+            if key.startswith('#'):   # '#refs#', '#subsystem#'
+                continue
+            if isinstance(node, h5py.Group):
+                names += [f"{key}/{field}" for field, child in node.items() if is_vector(child)]
+            elif is_vector(node):
+                names.append(key)
+    return names
+
+
+def _read_mat73_vector(full: str, name: str, sample_range=None) -> np.ndarray:
+    # MATLAB stores arrays transposed, so an nx1 / 1xn vector is (1, n) / (n, 1)
+    rows = slice(*sample_range) if sample_range else slice(None)
+    with h5py.File(full, 'r') as f:
+        ds = f[name]
+        if ds.ndim == 2 and ds.shape[0] == 1:
+            return ds[0, rows]
+        if ds.ndim == 2 and ds.shape[1] == 1:
+            return ds[rows, 0]
+        return ds[()].ravel()[rows]
+
+
+def open_mat73(path: str, file: str, columns=None, sample_range=None) -> LazyColumns:
+    """Open a MATLAB v7.3 .mat file as LazyColumns. Only the requested
+    columns (all double fields by default) are exposed, and each is read on
+    first access; sample_range=(start, stop) limits the samples read."""
+    _require_h5py()
+    full = os.path.join(path, file)
+    names = _mat73_vectors(full)
+    if not names:
+        raise ValueError("No double vector fields found in the .mat file.")
+    wanted = None if columns is None else set(columns)
+    return LazyColumns({n.replace('/', '.'): partial(_read_mat73_vector, full, n, sample_range)
+                        for n in names if wanted is None or n.replace('/', '.') in wanted})
+
+
+def load_file(path: str, file: str, columns=None, cache=True, storage='memory', sample_range=None):
+    """Load a single .xlsx / .csv / .mat file into a ColumnTable.
+    columns optionally limits the load to the named columns (all by default).
+    With cache=True parsed columns are read from / written to .plotter_cache.
+    storage='memmap' returns a LazyColumns table backed by memory-mapped
+    cache files instead of in-memory arrays (falls back to memory if
+    the columns cannot be cached). storage='stream' reads CSV files in chunks
+    into an EnvelopeTable (other file types load into memory).
+    MATLAB v7.3 files are always opened lazily (see open_mat73), and
+    sample_range=(start, stop) limits which of their samples are read."""
+    if file.endswith('.mat') and is_mat73(os.path.join(path, file)):
+        return open_mat73(path, file, columns, sample_range)
+
+    if storage == 'stream' and file.endswith('.csv'):
+        return stream_csv_envelope(path, file, columns)
+
+    if storage == 'memmap':
+        table = open_memmap_cache(path, file, columns)
+        if table is None:
+            df = _parse_file(path, file, columns)
+            write_cache(path, file, df, complete=columns is None)
+            table = open_memmap_cache(path, file, columns)
+            if table is None:
+                return df
+            del df   # only the memory-mapped copy is kept
+        return table
+
+    if cache:
+        df = read_cache(path, file, columns)
+        if df is not None:
+            return df
+    df = _parse_file(path, file, columns)
+    if cache:
+        write_cache(path, file, df, complete=columns is None)
+    return df
+
+
+def _parse_file(path: str, file: str, columns=None) -> ColumnTable:
+    # Parse a data file with openpyxl / pandas / scipy (no caching)
+    file, sheet = split_sheet_key(file)
+    if file.endswith('.xlsx'):
+        return read_xlsx(path, file, sheet, columns)
+    elif file.endswith('.csv'):
+        usecols = None
+        if columns is not None:
+            wanted = set(columns)
+            usecols = lambda c: c in wanted
+        return ColumnTable.from_frame(pd.read_csv(os.path.join(path, file), usecols=usecols))
+    elif file.endswith('.mat'):
+        return mat_struct_to_dataframe(path, file, columns)
+    raise ValueError(f"Unsupported file type: {file}")
+
+
+def probe_columns(path: str, file: str) -> list:
+    """Return the column names of a data file without parsing its data.
+    Reads the CSV header line, the first XLSX row, or the .mat variable
+    table (whosmat), so it is fast even for very large recordings."""
+    file, sheet = split_sheet_key(file)
+    full = os.path.join(path, file)
+    if file.endswith('.xlsx'):
+        return read_xlsx(path, file, sheet, header_only=True)
+    elif file.endswith('.csv'):
+        return list(pd.read_csv(full, nrows=0).columns)
+    elif file.endswith('.mat') and is_mat73(full):
+        _require_h5py()
+        cols = [n.replace('/', '.') for n in _mat73_vectors(full)]
+        if not cols:
+            raise ValueError("No double vector fields found in the .mat file.")
+        return cols
+    elif file.endswith('.mat'):
+        # same filter as mat_struct_to_dataframe: floating-point variables only
+        cols = [name for name, shape, cls in whosmat(full)
+                if cls in ('double', 'single') and not name.startswith('__')]
+        if not cols:
+            raise ValueError("No double vector fields found in the .mat file.")
+        return cols
+    raise ValueError(f"Unsupported file type: {file}")
+
+
+def probe_files(path: str, files):
+    """Probe the columns of several files. Returns (schemas, errors) where
+    schemas maps filename -> list of column names in the order of `files`."""
+    schemas, errors = {}, {}
+    for f in files:
+        try:
+            schemas[f] = probe_columns(path, f)
+        except Exception as ex:
+            errors[f] = ex
+    return schemas, errors
+
+
+# -- Folder index ---------------------------------------------------------------
+# <data folder>/.plotter_cache/index.json holds a summary of every data file in
+# the folder (size, rows, columns, time span, sample rate) so the file list can
+# show and filter it without loading anything. Entries are refreshed when a
+# file's size or mtime changes.
+
+INDEX_FILENAME = 'index.json'
+
+
+def guess_time_column(columns) -> str:
+    """Name of the column most likely to hold time (first one by default)."""
+    for c in columns:
+        name = str(c).strip().lower()
+        if 'time' in name or name in ('t', 's', 'sec', 'seconds'):
+            return c
+    return columns[0]
+
+
+def file_info(path: str, file: str) -> dict:
+    """Summary of one data file for the folder index. Reads the column names
+    and the time column only (which also fills the column cache)."""
+    st = os.stat(os.path.join(path, file))
+    columns = probe_columns(path, file)
+    time_col = guess_time_column(columns)
+    t = np.asarray(load_file(path, file, [time_col])[time_col], dtype=float)
+    info = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'rows': int(len(t)), 'columns': [str(c) for c in columns],
+            'time_column': str(time_col), 'start': None, 'end': None,
+            'duration': None, 'sample_rate': None}
+    if len(t):
+        info['start'], info['end'] = float(t[0]), float(t[-1])
+        info['duration'] = info['end'] - info['start']
+        if info['duration'] > 0:
+            info['sample_rate'] = (len(t) - 1) / info['duration']
+    return info
+
+
+def read_index(path: str) -> dict:
+    """The folder index as {file: info} (may include stale entries)."""
+    try:
+        with open(os.path.join(path, CACHE_DIRNAME, INDEX_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_index(path: str, files=None, on_update=None) -> dict:
+    """Bring the folder index up to date and return it. Only files whose size
+    or mtime changed are re-read; on_update(file, info) is called for each
+    (info is None if the file could not be read). Runs fine in a background
+    thread; the index is written after every file so progress is kept."""
+    if files is None:
+        files = sorted(f for f in os.listdir(path) if f.endswith(DATA_EXTENSIONS))
+    index = {f: info for f, info in read_index(path).items() if f in files}
+    index_path = os.path.join(path, CACHE_DIRNAME, INDEX_FILENAME)
+
+    for f in files:
+        try:
+            st = os.stat(os.path.join(path, f))
+        except OSError:
+            continue
+        old = index.get(f)
+        if old and old.get('size') == st.st_size and old.get('mtime_ns') == st.st_mtime_ns:
+            continue
+        try:
+            index[f] = info = file_info(path, f)
+        except Exception:
+            info = None
+        if on_update is not None:
+            on_update(f, info)
+        if info is None:
+            continue
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            tmp_path = _tmp_path(index_path)
+            with open(tmp_path, 'w') as fh:
+                json.dump(index, fh)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            pass   # read-only folder -- index only lives in memory
+    return index
+
+
+def load_files(path: str, files, columns=None, progress=None, max_workers=None, cache=True,
+               storage='memory', sample_range=None):
+    """Load several data files concurrently.
+
+    columns optionally maps filename -> column names to load from that file
+    (see Plotter.required_columns); files missing from it load every column.
+    Returns (dataframes, errors): dataframes maps filename -> table in the
+    order of `files`, errors maps filename -> exception for files that
+    failed. progress(done, total, file, error) is called from the calling
+    thread as each file finishes, so it is safe to update Tk widgets in it.
+    cache, storage and sample_range are passed on to load_file.
+    """
+    files = list(files)
+    columns = columns or {}
+    if not files:
+        return {}, {}
+    if max_workers is None:
+        max_workers = min(len(files), os.cpu_count() or 4)
+
+    # pd.read_csv / loadmat spend most of their time outside the GIL, so
+    # threads are enough. read_excel is pure Python (openpyxl), so several
+    # workbooks that need parsing go to a process pool instead. Lazy tables
+    # (memmap, v7.3 .mat) can't be sent back from a process, so everything
+    # else stays on threads.
+    in_process = [f for f in files if split_sheet_key(f)[0].endswith('.xlsx') and not
+                  (cache and _cache_covers(_read_meta(path, f), columns.get(f)))]
+    if len(in_process) < 2 or storage == 'memmap':
+        in_process = []
+
+    loaded, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as threads, \
+         ProcessPoolExecutor(max_workers=min(len(in_process) or 1, max_workers)) as procs:
+        futures = {(procs if f in in_process else threads).submit(
+                       load_file, path, f, columns.get(f), cache, storage, sample_range): f
+                   for f in files}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            f = futures[fut]
+            try:
+                loaded[f] = fut.result()
+                err = None
+            except Exception as ex:
+                errors[f] = err = ex
+            if progress is not None:
+                progress(done, len(files), f, err)
+
+    # keep the caller's file order (as_completed yields in finish order)
+    dataframes = {f: loaded[f] for f in files if f in loaded}
+    return dataframes, errors
@@ -8,14 +8,17 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import numpy as np
-import pandas as pd
 import os
+import re
 import pickle
-from scipy.io import loadmat
+import queue
+import threading
 from scipy.interpolate import interp1d
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('TkAgg')
+from PlotterData import (DATA_EXTENSIONS, STORAGE_MODES, load_files, probe_files,
+                         list_sheets, sheet_key, read_index, update_index)
 
 # -- Colour Palette ----------------------------------------------------------
 BG        = "#0f1117"
@@ -34,9 +37,11 @@ FONT_L    = ("Courier New", 14, "bold")
 FONT_XL   = ("Courier New", 18, "bold")
 
 # -- Helpers ------------------------------------------------------------------
-def _noop():
+def _noop(*args):
     """Module-level no-op used to replace save_data_plot on Plotter instances.
-    Must be at module scope so pickle can serialise the object."""
+    Plotter.__getstate__ leaves it out of pickles; older pickles still name it,
+    so it stays at module scope (PlotterClass.load_pickle maps it without
+    importing the GUI)."""
     pass
 
 def style_widget(w, **kw):
@@ -104,34 +109,46 @@ def scrollable_frame(parent):
     return outer, inner
 
 
-# -- mat helper (mirrors PlotterClass) ----------------------------------------
-def mat_struct_to_dataframe(path: str, file: str) -> pd.DataFrame:
-    mat = loadmat(os.path.join(path, file), squeeze_me=True)
-    columns = {}
-    for key, value in mat.items():
-        if key.startswith("__"):
-            continue
-        if not isinstance(value, np.ndarray):
-            continue
-        if not np.issubdtype(value.dtype, np.floating):
-            continue
-        columns[key] = value.flatten()
-    if not columns:
-        raise ValueError("No double vector fields found in the .mat file.")
-    lengths = {n: a.size for n, a in columns.items()}
-    if len(set(lengths.values())) > 1:
-        raise ValueError(f"Mismatched field lengths: {lengths}")
-    return pd.DataFrame(columns)
-
-
-def load_file(path: str, file: str) -> pd.DataFrame:
-    if file.endswith('.xlsx'):
-        return pd.read_excel(os.path.join(path, file))
-    elif file.endswith('.csv'):
-        return pd.read_csv(os.path.join(path, file))
-    elif file.endswith('.mat'):
-        return mat_struct_to_dataframe(path, file)
-    raise ValueError(f"Unsupported file type: {file}")
+# -- Folder index helpers (Window2 file list) ----------------------------------
+_FILTER_TERM = re.compile(r'^(rows|cols|dur|rate)(<=|>=|<|>|=)([-+.\deE]+)$')
+_FILTER_KEYS = {"rows": "rows", "dur": "duration", "rate": "sample_rate"}
+
+
+def format_file_info(info):
+    """One-line summary of a folder index entry."""
+    if not info:
+        return "indexing..."
+    parts = [f"{info['rows']} rows", f"{len(info['columns'])} cols"]
+    if info.get("duration") is not None:
+        parts.append(f"{info['duration']:.4g} s")
+    if info.get("sample_rate") is not None:
+        parts.append(f"{info['sample_rate']:.4g} Hz")
+    return "  |  ".join(parts)
+
+
+def matches_filter(file, info, text):
+    """True if the file passes every term of the filter text. Terms are
+    rows/cols/dur/rate comparisons (e.g. rate>=1000, dur<5) or plain text
+    matched against the file name and its column names."""
+    for term in text.lower().split():
+        m = _FILTER_TERM.match(term)
+        if m:
+            if not info:
+                return False
+            key, op, num = m.groups()
+            val = len(info["columns"]) if key == "cols" else info.get(_FILTER_KEYS[key])
+            if val is None:
+                return False
+            num = float(num)
+            ok = {"<": val < num, ">": val > num, "<=": val <= num,
+                  ">=": val >= num, "=": val == num}[op]
+            if not ok:
+                return False
+        else:
+            cols = info["columns"] if info else []
+            if term not in file.lower() and not any(term in c.lower() for c in cols):
+                return False
+    return True
 
 
 # ============================================================================
@@ -143,6 +160,9 @@ class Window1_ModeSelect(tk.Tk):
         ("plot_single_axis", "[Y1]   Single Axis Plot",   "Plot one or more signals on a shared Y-axis"),
         ("plot_twin_axes",   "[Y2]   Twin Axes Plot",     "Plot signals on two independent Y-axes"),
         ("plot_bode",        "[FFT]  Bode Plot",          "Frequency-domain magnitude & phase from chirp data"),
+        ("plot_density",     "[DEN]  Density Plot",       "2-D histogram of many trials with mean/percentile lines"),
+        ("plot_trial_stats", "[AVG]  Trial Statistics",   "Mean +/- std and percentile bands across trials"),
+        ("plot_stacked",     "[STK]  Stacked Panels",     "One panel per signal label on a shared X-axis"),
     ]
 
     def __init__(self):
@@ -208,9 +228,16 @@ class Window2_FileSelect(tk.Tk):
         self.mode = mode
         self.title("Plotter - Select Data Files")
         self.configure(bg=BG)
-        self.geometry("640x560")
+        self.geometry("760x600")
         self._folder = tk.StringVar()
         self._file_vars = {}   # filename -> BooleanVar
+        self._sheet_vars = {}  # xlsx filename -> {sheet name: BooleanVar}
+        self._file_rows = {}   # filename -> (row Frame, info Label)
+        self._index = {}       # filename -> folder index entry (PlotterData.update_index)
+        self._index_queue = queue.Queue()
+        self._index_gen = 0    # bumped per folder so late results from an old folder are ignored
+        self._poll_id = None   # pending _poll_index `after` call (one at a time)
+        self._filter = tk.StringVar()
         self._dataframes = {}
         self._build()
         self.eval('tk::PlaceWindow . center')
@@ -248,6 +275,14 @@ class Window2_FileSelect(tk.Tk):
         tk.Label(body, text="(check all files you want to include)",
                  bg=BG, fg=TEXT_DIM, font=FONT_S).pack(anchor="w", pady=(0, 6))
 
+        frow = tk.Frame(body, bg=BG)
+        frow.pack(fill="x", pady=(0, 6))
+        tk.Label(frow, text="Filter:", bg=BG, fg=TEXT_DIM, font=FONT_S).pack(side="left")
+        make_entry(frow, textvariable=self._filter, width=30).pack(side="left", padx=(6, 8))
+        tk.Label(frow, text="text, rows>1000, cols>=4, dur<5, rate>=1000",
+                 bg=BG, fg=TEXT_DIM, font=FONT_S).pack(side="left")
+        self._filter.trace_add("write", lambda *a: self._apply_filter())
+
         list_outer, self._list_inner = scrollable_frame(body)
         list_outer.pack(fill="both", expand=True)
 
@@ -270,25 +305,116 @@ class Window2_FileSelect(tk.Tk):
         for w in self._list_inner.winfo_children():
             w.destroy()
         self._file_vars.clear()
+        self._sheet_vars.clear()
+        self._file_rows.clear()
 
-        files = [f for f in os.listdir(folder)
-                 if f.endswith(('.xlsx', '.csv', '.mat'))]
+        files = sorted(f for f in os.listdir(folder)
+                       if f.endswith(DATA_EXTENSIONS))
 
         if not files:
             tk.Label(self._list_inner, text="No .xlsx / .csv / .mat files found.",
                      bg=PANEL, fg=ACCENT2, font=FONT_S, pady=12).pack(fill="x")
             return
 
-        for f in sorted(files):
+        # Show what the index already knows right away (possibly stale entries
+        # are refreshed by the background indexer below)
+        self._index = read_index(folder)
+
+        for f in files:
             var = tk.BooleanVar(value=False)
             self._file_vars[f] = var
             row = tk.Frame(self._list_inner, bg=PANEL, pady=4, padx=10)
-            row.pack(fill="x")
             cb = tk.Checkbutton(row, variable=var, bg=PANEL,
                                 activebackground=PANEL, selectcolor=BG,
                                 fg=ACCENT, highlightthickness=0)
             cb.pack(side="left")
             tk.Label(row, text=f, bg=PANEL, fg=TEXT, font=FONT_B).pack(side="left")
+            info_lbl = tk.Label(row, text=format_file_info(self._index.get(f)),
+                                bg=PANEL, fg=TEXT_DIM, font=FONT_S)
+            info_lbl.pack(side="left", padx=(10, 0))
+            if f.endswith('.xlsx'):
+                sheets_lbl = tk.Label(row, text="", bg=PANEL, fg=TEXT_DIM, font=FONT_S)
+                make_button(row, "Sheets", lambda f=f, l=sheets_lbl: self._choose_sheets(f, l),
+                            small=True).pack(side="right")
+                sheets_lbl.pack(side="right", padx=(0, 6))
+            self._file_rows[f] = (row, info_lbl)
+        self._apply_filter()
+
+        # Index new / changed files in the background; results come back
+        # through _index_queue and are applied on the Tk thread
+        self._index_gen += 1
+        gen, q = self._index_gen, self._index_queue
+        threading.Thread(target=update_index, args=(folder, files),
+                         kwargs=dict(on_update=lambda f, info: q.put((gen, f, info))),
+                         daemon=True).start()
+        self._cancel_poll()
+        self._poll_id = self.after(100, self._poll_index)
+
+    def _cancel_poll(self):
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def destroy(self):
+        self._cancel_poll()
+        super().destroy()
+
+    def _poll_index(self):
+        changed = False
+        while True:
+            try:
+                gen, f, info = self._index_queue.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self._index_gen or f not in self._file_rows:
+                continue
+            self._index[f] = info
+            self._file_rows[f][1].configure(
+                text=format_file_info(info) if info else "could not index")
+            changed = True
+        if changed and self._filter.get().strip():
+            self._apply_filter()
+        self._poll_id = self.after(250, self._poll_index)
+
+    def _apply_filter(self):
+        text = self._filter.get()
+        for f, (row, _) in self._file_rows.items():
+            row.pack_forget()
+        for f, (row, _) in self._file_rows.items():
+            if matches_filter(f, self._index.get(f), text):
+                row.pack(fill="x")
+
+    def _choose_sheets(self, file, summary_lbl):
+        """Let the user pick which sheet(s) of a workbook to load.
+        Without a choice only the first sheet is loaded."""
+        try:
+            sheets = list_sheets(self._folder.get().strip(), file)
+        except Exception as ex:
+            messagebox.showerror("Load Error", f"Could not read {file}:\n{ex}")
+            return
+        if file not in self._sheet_vars:
+            self._sheet_vars[file] = {sh: tk.BooleanVar(value=(i == 0))
+                                      for i, sh in enumerate(sheets)}
+        vars_ = self._sheet_vars[file]
+
+        dlg = tk.Toplevel(self, bg=PANEL, padx=16, pady=12)
+        dlg.title(f"Sheets - {file}")
+        dlg.transient(self)
+        tk.Label(dlg, text="SELECT SHEETS", bg=PANEL, fg=ACCENT,
+                 font=FONT_H).pack(anchor="w", pady=(0, 6))
+        for sh in sheets:
+            tk.Checkbutton(dlg, text=sh, variable=vars_[sh],
+                           bg=PANEL, fg=TEXT, selectcolor=BG,
+                           activebackground=PANEL, font=FONT_B,
+                           highlightthickness=0).pack(anchor="w")
+
+        def _done():
+            chosen = [sh for sh in sheets if vars_[sh].get()]
+            summary_lbl.configure(text=", ".join(chosen))
+            self._file_vars[file].set(bool(chosen))
+            dlg.destroy()
+        make_button(dlg, "Done", _done, accent=True, small=True).pack(fill="x", pady=(10, 0))
+        dlg.grab_set()
 
     def _continue(self):
         folder = self._folder.get().strip()
@@ -296,23 +422,37 @@ class Window2_FileSelect(tk.Tk):
             messagebox.showerror("Error", "Please select a valid folder.")
             return
 
-        selected = [f for f, v in self._file_vars.items() if v.get()]
+        # Workbooks with chosen sheets are loaded as one entry per sheet
+        selected = []
+        for f, v in self._file_vars.items():
+            if not v.get():
+                continue
+            sheets = [sh for sh, sv in self._sheet_vars.get(f, {}).items() if sv.get()]
+            if sheets:
+                selected += [sheet_key(f, sh) for sh in sheets]
+            else:
+                selected.append(f)
 
         if not selected:
             messagebox.showerror("Error", "Please select at least one file.")
             return
 
-        # Load dataframes
-        dfs = {}
-        for f in selected:
-            try:
-                dfs[f] = load_file(folder, f)
-            except Exception as ex:
-                messagebox.showerror("Load Error", f"Could not load {f}:\n{ex}")
+        # Only read the column names here -- the data itself is loaded when
+        # the plot is generated, once the columns to plot are known
+        schemas, errors = probe_files(folder, selected)
+
+        if errors:
+            msg = "\n".join(f"{f}: {ex}" for f, ex in errors.items())
+            if not schemas:
+                messagebox.showerror("Load Error", f"Could not load:\n{msg}")
+                return
+            if not messagebox.askyesno("Load Error",
+                                       f"Could not load:\n{msg}\n\nContinue without these files?"):
                 return
+            selected = [f for f in selected if f in schemas]
 
         self.destroy()
-        Window3_Config(self.mode, folder, selected, dfs).mainloop()
+        Window3_Config(self.mode, folder, selected, schemas).mainloop()
 
 
 # ============================================================================
@@ -320,12 +460,17 @@ class Window2_FileSelect(tk.Tk):
 # ============================================================================
 class Window3_Config(tk.Tk):
     def __init__(self, mode: str, folder: str,
-                 selected_files: list, dataframes: dict):
+                 selected_files: list, schemas: dict):
         super().__init__()
         self.mode = mode
         self.folder = folder
         self.selected_files = selected_files
-        self.dataframes = dataframes
+        self.schemas = schemas      # file -> column names (from probe_files)
+        self.dataframes = {}        # file -> loaded data, filled in by _load_dataframes
+        self._loaded_cols = {}      # file -> set of columns currently in self.dataframes[file]
+        self._loaded_storage = None # storage mode self.dataframes was loaded with
+        self._load_poll_id = None   # pending _poll_load `after` call while files load
+        self._render = None # (key, fig, linewidth) of the last plot, see _render_plot
 
         self.title("Plotter - Configure Plot")
         self.configure(bg=BG)
@@ -345,9 +490,10 @@ class Window3_Config(tk.Tk):
         self._ylim2_lo    = tk.StringVar(value="")
         self._ylim2_hi    = tk.StringVar(value="")
         self._legend      = tk.BooleanVar(value=True)
+        self._storage     = tk.StringVar(value="memory")  # PlotterData.STORAGE_MODES
         self._verbose     = tk.BooleanVar(value=False)
         self._figw        = tk.StringVar(value="7")
-        self._figh        = tk.StringVar(value="4")
+        self._figh        = tk.StringVar(value="" if mode == "plot_stacked" else "4") # blank: auto for stacked panels
         self._title_fs    = tk.StringVar(value="")
         self._label_fs    = tk.StringVar(value="")
         self._tick_fs     = tk.StringVar(value="")
@@ -359,7 +505,15 @@ class Window3_Config(tk.Tk):
         self._pickle_name      = tk.StringVar(value="")
         self._save_png         = tk.BooleanVar(value=False)
         self._png_name         = tk.StringVar(value="")
+        self._export_png       = tk.BooleanVar(value=True)
+        self._export_pdf       = tk.BooleanVar(value=False)
+        self._export_svg       = tk.BooleanVar(value=False)
+        self._export_thumb     = tk.BooleanVar(value=False)
+        self._rasterize_lines  = tk.BooleanVar(value=False)
         self._display_plot     = tk.BooleanVar(value=True)
+        self._decimate         = tk.BooleanVar(value=True)
+        self._batch_lines      = tk.BooleanVar(value=False)
+        self._fast_text        = tk.BooleanVar(value=False)
         self._save_font_scale  = tk.StringVar(value="1.5")
 
         # bode-specific
@@ -367,6 +521,11 @@ class Window3_Config(tk.Tk):
         self._end_freq    = tk.StringVar(value="200")
         self._sample_rate = tk.StringVar(value="10000")
 
+        # density / trial statistics
+        self._density_mean = tk.BooleanVar(value=True)
+        self._stats_std    = tk.BooleanVar(value=True)
+        self._percentiles  = tk.StringVar(value="5, 95")
+
         # column selection data (built dynamically)
         # x_selections[file] = column StringVar
         # y_selections[file] = list of {col: StringVar, label: StringVar, axis: IntVar}
@@ -401,14 +560,22 @@ class Window3_Config(tk.Tk):
             self._build_y_section(body)
             if self.mode == "plot_bode":
                 self._build_bode_params(body)
+            if self.mode == "plot_density":
+                self._build_density_params(body)
+            if self.mode == "plot_trial_stats":
+                self._build_stats_params(body)
 
         self._build_props_section(body)
 
         # Footer button
         foot = tk.Frame(self, bg=BG, pady=12, padx=28)
         foot.pack(fill="x", side="bottom")
-        make_button(foot, ">>  GENERATE PLOT", self._run,
-                    accent=True).pack(fill="x")
+        self._status_lbl = tk.Label(foot, text="", bg=BG, fg=TEXT_DIM,
+                                    font=FONT_S, anchor="w")
+        self._status_lbl.pack(fill="x", pady=(0, 6))
+        self._plot_btn = make_button(foot, ">>  GENERATE PLOT", self._run,
+                                     accent=True)
+        self._plot_btn.pack(fill="x")
 
     # -- Pickle section -------------------------------------------------------
     def _build_pickle_section(self, body):
@@ -472,6 +639,10 @@ class Window3_Config(tk.Tk):
         columns = getattr(obj, "columns", None)
         plot_type = getattr(obj, "plot_type", "unknown")
 
+        # Stacked panels size their height by panel count unless one is typed in
+        if plot_type == "stacked" and self._figh.get().strip() == "4":
+            self._figh.set("")
+
         # Show or hide Y2 limits and Y Label 2 depending on the pickle's plot type
         needs_y2 = plot_type in ("twin_axes", "bode")
         if hasattr(self, "_y2_label_widget"):
@@ -565,8 +736,8 @@ class Window3_Config(tk.Tk):
         for w in self._x_col_menu_frame.winfo_children():
             w.destroy()
         fname = self._x_file.get()
-        if fname in self.dataframes:
-            cols = list(self.dataframes[fname].columns)
+        if fname in self.schemas:
+            cols = list(self.schemas[fname])
             self._x_col.set(cols[0])
             om = tk.OptionMenu(self._x_col_menu_frame, self._x_col, *cols)
             om.configure(bg=CARD, fg=TEXT, font=FONT_B,
@@ -581,8 +752,7 @@ class Window3_Config(tk.Tk):
         section_label(body, lbl).pack(fill="x", pady=(8, 10))
 
         for fname in self.selected_files:
-            df = self.dataframes[fname]
-            cols = list(df.columns)
+            cols = list(self.schemas[fname])
             self._y_rows[fname] = []
             if is_bode:
                 self._bode_inputs[fname] = []
@@ -635,8 +805,8 @@ class Window3_Config(tk.Tk):
             # Input col -- can come from ANY loaded file
             # Build flat list of "filename :: colname" strings across all files
             all_input_opts = []
-            for f, df in self.dataframes.items():
-                for c in df.columns:
+            for f, cols_f in self.schemas.items():
+                for c in cols_f:
                     all_input_opts.append(f"{f} :: {c}")
             input_var = tk.StringVar(value=all_input_opts[0] if all_input_opts else "")
             tk.Label(row, text="Input col:", bg=row_bg, fg=TEXT_DIM,
@@ -711,6 +881,36 @@ class Window3_Config(tk.Tk):
                      font=FONT_S).grid(row=0, column=col_i*2, sticky="w", padx=(0, 4), pady=2)
             make_entry(grid, textvariable=var, width=10).grid(row=0, column=col_i*2+1, padx=(0, 16))
 
+    def _build_density_params(self, body):
+        section_label(body, "DENSITY PARAMETERS").pack(fill="x", pady=(12, 8))
+        grid = tk.Frame(body, bg=PANEL)
+        grid.pack(anchor="w")
+        tk.Checkbutton(grid, text="Mean Line", variable=self._density_mean,
+                       bg=PANEL, fg=TEXT, selectcolor=BG,
+                       activebackground=PANEL, font=FONT_S,
+                       highlightthickness=0).grid(row=0, column=0, sticky="w", padx=(0, 16))
+        tk.Label(grid, text="Percentiles", bg=PANEL, fg=TEXT_DIM,
+                 font=FONT_S).grid(row=0, column=1, sticky="w", padx=(0, 4), pady=2)
+        make_entry(grid, textvariable=self._percentiles, width=12).grid(row=0, column=2, padx=(0, 8))
+        tk.Label(grid, text="(comma separated, blank for none)", bg=PANEL, fg=TEXT_DIM,
+                 font=FONT_S).grid(row=0, column=3, sticky="w")
+
+    def _build_stats_params(self, body):
+        section_label(body, "TRIAL STATISTICS").pack(fill="x", pady=(12, 8))
+        tk.Label(body, text="Signals with the same label are grouped across files.",
+                 bg=PANEL, fg=TEXT_DIM, font=FONT_S).pack(anchor="w", pady=(0, 4))
+        grid = tk.Frame(body, bg=PANEL)
+        grid.pack(anchor="w")
+        tk.Checkbutton(grid, text="Std Band", variable=self._stats_std,
+                       bg=PANEL, fg=TEXT, selectcolor=BG,
+                       activebackground=PANEL, font=FONT_S,
+                       highlightthickness=0).grid(row=0, column=0, sticky="w", padx=(0, 16))
+        tk.Label(grid, text="Percentile Band", bg=PANEL, fg=TEXT_DIM,
+                 font=FONT_S).grid(row=0, column=1, sticky="w", padx=(0, 4), pady=2)
+        make_entry(grid, textvariable=self._percentiles, width=12).grid(row=0, column=2, padx=(0, 8))
+        tk.Label(grid, text="(low, high -- blank for none)", bg=PANEL, fg=TEXT_DIM,
+                 font=FONT_S).grid(row=0, column=3, sticky="w")
+
     # -- Plot properties section ----------------------------------------------
     def _build_props_section(self, body):
         section_label(body, "PLOT PROPERTIES").pack(fill="x", pady=(16, 10))
@@ -733,6 +933,19 @@ class Window3_Config(tk.Tk):
         om["menu"].configure(bg=CARD, fg=TEXT, font=FONT_S)
         om.grid(row=0, column=1, sticky="w")
 
+        # Data storage: memory = DataFrames, memmap = memory-mapped column
+        # cache, stream = chunked CSV min/max envelopes (single / twin axes only)
+        if self.mode != "plot_pickle":
+            tk.Label(outer, text="Data Storage", bg=PANEL, fg=TEXT_DIM,
+                     font=FONT_S, width=14, anchor="w").grid(row=5, column=0, sticky="w", pady=3)
+            storages = [m for m in STORAGE_MODES
+                        if m != "stream" or self.mode in ("plot_single_axis", "plot_twin_axes")]
+            om_st = tk.OptionMenu(outer, self._storage, *storages)
+            om_st.configure(bg=CARD, fg=TEXT, font=FONT_S,
+                            activebackground=BORDER, highlightthickness=0, relief="flat")
+            om_st["menu"].configure(bg=CARD, fg=TEXT, font=FONT_S)
+            om_st.grid(row=5, column=1, sticky="w")
+
         row_pair(outer, 1, "Title",   self._title)
         row_pair(outer, 2, "X Label", self._xlabel)
         row_pair(outer, 3, "Y Label 1", self._ylabel1)
@@ -809,12 +1022,27 @@ class Window3_Config(tk.Tk):
         # Legend + Display
         tog = tk.Frame(body, bg=PANEL, pady=8)
         tog.pack(anchor="w")
-        for var, lbl in [(self._legend, "Show Legend"),
-                         (self._display_plot, "Display Plot")]:
+        toggles = [(self._legend, "Show Legend"),
+                   (self._display_plot, "Display Plot"),
+                   (self._decimate, "Decimate Lines"),
+                   (self._fast_text, "Fast Text")]
+        if self.mode in ("plot_single_axis", "plot_stacked", "plot_pickle"):
+            toggles.append((self._batch_lines, "Batch Lines"))
+        for var, lbl in toggles:
             tk.Checkbutton(tog, text=lbl, variable=var,
                            bg=PANEL, fg=TEXT, selectcolor=BG,
                            activebackground=PANEL, font=FONT_B,
                            highlightthickness=0).pack(side="left", padx=(0, 20))
+        tk.Label(body, text="Decimate Lines draws min/max per pixel column (fast). "
+                            "Turn off for publication exports.",
+                 bg=PANEL, fg=TEXT_DIM, font=FONT_S).pack(anchor="w")
+        tk.Label(body, text="Fast Text renders the science styles with mathtext "
+                            "instead of LaTeX (much faster, near-identical look).",
+                 bg=PANEL, fg=TEXT_DIM, font=FONT_S).pack(anchor="w")
+        if self.mode in ("plot_single_axis", "plot_stacked", "plot_pickle"):
+            tk.Label(body, text="Batch Lines draws all series as one collection "
+                                "(overlays of 100+ trials, single axis and stacked only).",
+                     bg=PANEL, fg=TEXT_DIM, font=FONT_S).pack(anchor="w")
 
         # Save options
         section_label(body, "SAVE OPTIONS").pack(fill="x", pady=(16, 8))
@@ -826,7 +1054,7 @@ class Window3_Config(tk.Tk):
                  font=FONT_B, width=16, anchor="w").pack(side="left")
         make_entry(scale_row, textvariable=self._save_font_scale, width=6).pack(side="left")
         tk.Label(scale_row,
-                 text="  multiplies all font sizes for the saved PNG  (default 1.5)",
+                 text="  multiplies all font sizes for the saved plot  (default 1.5)",
                  bg=PANEL, fg=TEXT_DIM, font=FONT_S).pack(side="left", padx=(6, 0))
 
         # Pickle save
@@ -847,7 +1075,7 @@ class Window3_Config(tk.Tk):
         # PNG save
         png_row = tk.Frame(body, bg=PANEL)
         png_row.pack(anchor="w", pady=(4, 0))
-        tk.Checkbutton(png_row, text="Save plot as PNG",
+        tk.Checkbutton(png_row, text="Save plot as image",
                        variable=self._save_png,
                        bg=PANEL, fg=TEXT, selectcolor=BG,
                        activebackground=PANEL, font=FONT_B,
@@ -859,6 +1087,19 @@ class Window3_Config(tk.Tk):
         tk.Label(png_row, text="(blank = use plot title)",
                  bg=PANEL, fg=TEXT_DIM, font=FONT_S).pack(side="left", padx=(6, 0))
 
+        # Formats -- all written from one layout pass (PlotterClass.export_figure)
+        fmt_row = tk.Frame(body, bg=PANEL)
+        fmt_row.pack(anchor="w", pady=(4, 0))
+        for var, lbl in [(self._export_png, "PNG"),
+                         (self._export_pdf, "PDF"),
+                         (self._export_svg, "SVG"),
+                         (self._export_thumb, "Thumbnail"),
+                         (self._rasterize_lines, "Rasterize dense lines in PDF/SVG")]:
+            tk.Checkbutton(fmt_row, text=lbl, variable=var,
+                           bg=PANEL, fg=TEXT, selectcolor=BG,
+                           activebackground=PANEL, font=FONT_S,
+                           highlightthickness=0).pack(side="left", padx=(0, 12))
+
     # -- Toggle helpers for save entries --------------------------------------
     def _toggle_pickle_name(self):
         state = "normal" if self._save_pickle.get() else "disabled"
@@ -889,10 +1130,38 @@ class Window3_Config(tk.Tk):
         v = self._parse_float(var.get())
         return int(v) if v is not False else False
 
+    # -- Render context -------------------------------------------------------
+    def _render_plot(self, plotter):
+        """Draw plotter's figure. If only style settings changed since the
+        last plot (same Plotter.data_key and the figure is still open), the
+        last figure is restyled in place; otherwise it is closed and the data
+        re-plotted, so figures don't pile up in pyplot. Not displaying renders
+        headless (no pyplot figure at all)."""
+        headless = not self._display_plot.get()
+        key = (headless, plotter.data_key())
+        if self._render is not None:
+            last_key, fig, linewidth = self._render
+            if last_key == key and (headless or plt.fignum_exists(fig.number)):
+                plotter.restyle(fig, linewidth)
+                self._render = (key, fig, plotter.linewidth)
+                return fig
+            plt.close(fig)
+            self._render = None
+
+        open_figs = set(plt.get_fignums())
+        try:
+            fig = plotter.plot_data(headless=headless)
+        except Exception:
+            for num in set(plt.get_fignums()) - open_figs:   # half-drawn figure
+                plt.close(num)
+            raise
+        self._render = (key, fig, plotter.linewidth)
+        return fig
+
     # -- GUI-driven save (replaces save_data_plot input() prompts) ------------
     def _gui_save(self, plotter, fig=None):
-        """Save pickle and/or PNG. fig must be the fully-drawn Figure object.
-        PNG is saved with font sizes scaled by _save_font_scale."""
+        """Save pickle and/or images. fig must be the fully-drawn Figure object.
+        Images are saved with font sizes scaled by _save_font_scale."""
 
         # Pickle save -- no figure needed, order doesn't matter
         if self._save_pickle.get():
@@ -916,14 +1185,25 @@ class Window3_Config(tk.Tk):
                 png_name = plotter.title if plotter.title else "plot"
             png_dir = os.path.join(self.folder, "Plots")
             os.makedirs(png_dir, exist_ok=True)
-            png_path = os.path.join(png_dir, png_name + ".png")
+            formats = [fmt for fmt, var in [("png", self._export_png),
+                                            ("pdf", self._export_pdf),
+                                            ("svg", self._export_svg)] if var.get()]
+            if not formats and not self._export_thumb.get():
+                messagebox.showwarning("Plot Save", "Select at least one image format.")
+                return
 
-            # Scale all text in the figure for the saved file, then restore
+            # Scale all text in the figure for the saved files, then restore
+            from PlotterClass import export_figure
             scale = self._parse_float(self._save_font_scale.get(), default=1.0)
             self._scale_fig_fonts(fig, scale)
-            fig.savefig(png_path, bbox_inches="tight", dpi=300)
-            self._scale_fig_fonts(fig, 1.0 / scale)   # restore
-            print(f"Plot saved to: {png_path}")
+            try:
+                with plotter.style_context():
+                    paths = export_figure(fig, os.path.join(png_dir, png_name), formats, dpi=300,
+                                          thumbnail=self._export_thumb.get(),
+                                          rasterize_lines=self._rasterize_lines.get())
+            finally:
+                self._scale_fig_fonts(fig, 1.0 / scale)   # restore
+            print(f"Plot saved to: {', '.join(paths)}")
 
     @staticmethod
     def _scale_fig_fonts(fig, scale):
@@ -939,19 +1219,113 @@ class Window3_Config(tk.Tk):
                 legend.get_title().set_fontsize(
                     legend.get_title().get_fontsize() * scale)
 
+    # -- Data loading ---------------------------------------------------------
+    def _load_dataframes(self, needed, storage, then):
+        """Parse (concurrently) only the columns the plot uses, then call
+        then(dataframes) on the Tk thread with this plot's files in order.
+        needed maps file -> set of column names (Plotter.required_columns).
+        Files are re-read only if a newly picked column is not loaded yet
+        or the storage mode changed. The files load in a worker thread;
+        progress and the result come back through a queue polled with
+        `after`, so the window keeps responding while they load."""
+        if storage != self._loaded_storage:
+            self.dataframes, self._loaded_cols = {}, {}
+            self._loaded_storage = storage
+        stale = [f for f in needed
+                 if not needed[f] <= self._loaded_cols.get(f, set())]
+        if not stale:
+            then(self._plot_frames(needed))
+            return
+
+        cols = {f: needed[f] | self._loaded_cols.get(f, set()) for f in stale}
+        q = queue.Queue()
+
+        def work():
+            try:
+                q.put(("done", load_files(self.folder, stale, columns=cols,
+                                          progress=lambda *args: q.put(("progress", args)),
+                                          storage=storage)))
+            except Exception as ex:
+                q.put(("error", ex))
+
+        self._plot_btn.configure(state="disabled")   # one load at a time
+        threading.Thread(target=work, daemon=True).start()
+        self._load_poll_id = self.after(50, self._poll_load, q, needed, cols, then)
+
+    def _poll_load(self, q, needed, cols, then):
+        while True:
+            try:
+                kind, payload = q.get_nowait()
+            except queue.Empty:
+                self._load_poll_id = self.after(50, self._poll_load, q, needed, cols, then)
+                return
+            if kind != "progress":
+                break
+            self._on_load_progress(*payload)
+
+        self._load_poll_id = None
+        self._plot_btn.configure(state="normal")
+        self._status_lbl.configure(text="")
+        if kind == "error":
+            self._show_error(payload)
+            return
+        dfs, errors = payload
+        if errors:
+            msg = "\n".join(f"{f}: {ex}" for f, ex in errors.items())
+            self._show_error(ValueError(f"Could not load:\n{msg}"))
+            return
+        self.dataframes.update(dfs)
+        self._loaded_cols.update(cols)
+        self._guarded(then, self._plot_frames(needed))
+
+    def _plot_frames(self, needed):
+        # keep file order, and only the files this plot uses
+        return {f: self.dataframes[f] for f in self.selected_files if f in needed}
+
+    def _on_load_progress(self, done, total, file, error):
+        status = "FAILED" if error is not None else "loaded"
+        self._status_lbl.configure(text=f"[{done}/{total}] {status}: {file}",
+                                   fg=ACCENT2 if error is not None else TEXT_DIM)
+
+    def destroy(self):
+        if self._load_poll_id is not None:
+            self.after_cancel(self._load_poll_id)
+            self._load_poll_id = None
+        super().destroy()
+
     # -- Run ------------------------------------------------------------------
     def _run(self):
+        self._guarded(self._do_run)
+
+    def _guarded(self, func, *args):
+        # Runs a step of plotting, reporting any error in a message box
         try:
-            self._do_run()
+            func(*args)
         except Exception as ex:
-            messagebox.showerror("Error", str(ex))
-            import traceback; traceback.print_exc()
+            self._show_error(ex)
+
+    def _show_error(self, ex):
+        messagebox.showerror("Error", str(ex))
+        import traceback; traceback.print_exception(type(ex), ex, ex.__traceback__)
+
+    def _load_and_plot(self, plotter, x_file, x_col):
+        # Loads the plot's columns (in the background), then draws, saves and shows it
+        def plot(dataframes):
+            plotter.dataframes    = dataframes
+            plotter.x_data_values = np.asarray(dataframes[x_file][x_col])
+            plotter.save_data_plot = _noop  # handled by _gui_save
+            fig = self._render_plot(plotter)
+            self._gui_save(plotter, fig=fig) # save BEFORE show
+            if self._display_plot.get():
+                plt.show(block=False)
+        self._load_dataframes(plotter.required_columns(), plotter.storage, plot)
 
     def _do_run(self):
         # Build shared Plotter kwargs
         figw = self._parse_float(self._figw.get(), 10)
-        figh = self._parse_float(self._figh.get(), 6)
-        figsize = (figw, figh)
+        figh = self._parse_float(self._figh.get(), None)
+        # blank height: 6, or auto (STACKED_PANEL_HEIGHT per panel) for stacked panels
+        figsize = (figw, False if figh is None and self.mode == "plot_stacked" else figh or 6)
 
         kwargs = dict(
             foldername      = self.folder,
@@ -970,7 +1344,11 @@ class Window3_Config(tk.Tk):
             label_fontsize  = self._parse_fontsize(self._label_fs),
             tick_fontsize   = self._parse_fontsize(self._tick_fs),
             legend_fontsize = self._parse_fontsize(self._legend_fs),
-            linewidth       = self._parse_float(self._linewidth.get(), default=2.0)
+            linewidth       = self._parse_float(self._linewidth.get(), default=2.0),
+            storage         = self._storage.get(),
+            decimate        = self._decimate.get(),
+            batch_lines     = self._batch_lines.get(),
+            fast_text       = self._fast_text.get(),
         )
 
         from PlotterClass import Plotter
@@ -998,12 +1376,15 @@ class Window3_Config(tk.Tk):
             plotpickle.ylimits1        = plotter.ylimits1
             plotpickle.ylimits2        = plotter.ylimits2
             plotpickle.legend          = plotter.legend
-            plotpickle.figsize         = plotter.figsize
+            plotpickle.figsize         = (figw, False) if figh is None and plotpickle.plot_type == "stacked" else plotter.figsize
             plotpickle.title_fontsize  = plotter.title_fontsize
             plotpickle.label_fontsize  = plotter.label_fontsize
             plotpickle.tick_fontsize   = plotter.tick_fontsize
             plotpickle.legend_fontsize = plotter.legend_fontsize
             plotpickle.linewidth       = plotter.linewidth
+            plotpickle.decimate        = plotter.decimate
+            plotpickle.batch_lines     = plotter.batch_lines
+            plotpickle.fast_text       = plotter.fast_text
 
             # Apply any edited labels from the GUI back onto the loaded object
             if self._pickle_label_vars:
@@ -1023,26 +1404,38 @@ class Window3_Config(tk.Tk):
 
             # Call plot_data directly (bypasses save_data_plot prompts)
             plotpickle.save_data_plot = _noop  # handled by _gui_save
-            plotpickle.plot_data()
-            fig = plt.gcf()           # capture the fully-drawn figure
+            # Not displaying: render headless on an Agg canvas (no pyplot/Tk figure)
+            fig = self._render_plot(plotpickle)
             self._gui_save(plotpickle, fig=fig)   # save BEFORE show
             if self._display_plot.get():
-                plt.show()
-            else:
-                plt.close(fig)
+                plt.show(block=False)
             return
 
         # ── Inject data into plotter (bypass select_data prompts) ────────────
-        plotter.dataframes     = self.dataframes
         plotter.selected_files = self.selected_files
 
-        if self.mode == "plot_single_axis":
-            plotter.plot_type = "single_axis"
+        if self.mode in ("plot_single_axis", "plot_density", "plot_trial_stats", "plot_stacked"):
+            plotter.plot_type = self.mode[len("plot_"):]
+            if self.mode in ("plot_density", "plot_trial_stats"):
+                try:
+                    percentiles = tuple(float(p) for p in self._percentiles.get().split(",") if p.strip())
+                except ValueError:
+                    messagebox.showerror("Error", "Percentiles must be comma separated numbers.")
+                    return
+                if self.mode == "plot_trial_stats" and len(percentiles) not in (0, 2):
+                    messagebox.showerror("Error", "Percentile band needs a low and a high percentile.")
+                    return
+            if self.mode == "plot_density":
+                plotter.density_mean        = self._density_mean.get()
+                plotter.density_percentiles = percentiles
+            elif self.mode == "plot_trial_stats":
+                plotter.stats_std         = self._stats_std.get()
+                plotter.stats_percentiles = percentiles
 
             x_file = self._x_file.get()
             x_col  = self._x_col.get()
+            plotter.x_file        = x_file
             plotter.x_data        = x_col
-            plotter.x_data_values = np.array(self.dataframes[x_file][x_col])
 
             columns = {}
             for fname, rows in self._y_rows.items():
@@ -1053,22 +1446,15 @@ class Window3_Config(tk.Tk):
                     tuples.append((col, lbl))
                 columns[fname] = tuple(tuples)
             plotter.columns = columns
-            plotter.save_data_plot = _noop  # handled by _gui_save
-            plotter.plot_data()
-            fig = plt.gcf()                  # capture fully-drawn figure
-            self._gui_save(plotter, fig=fig) # save BEFORE show
-            if self._display_plot.get():
-                plt.show()
-            else:
-                plt.close(fig)
+            self._load_and_plot(plotter, x_file, x_col)
 
         elif self.mode == "plot_twin_axes":
             plotter.plot_type = "twin_axes"
 
             x_file = self._x_file.get()
             x_col  = self._x_col.get()
+            plotter.x_file        = x_file
             plotter.x_data        = x_col
-            plotter.x_data_values = np.array(self.dataframes[x_file][x_col])
 
             columns = {}
             for fname, rows in self._y_rows.items():
@@ -1080,14 +1466,7 @@ class Window3_Config(tk.Tk):
                     tuples.append((col, axis, lbl))
                 columns[fname] = tuple(tuples)
             plotter.columns = columns
-            plotter.save_data_plot = _noop  # handled by _gui_save
-            plotter.plot_data()
-            fig = plt.gcf()                  # capture fully-drawn figure
-            self._gui_save(plotter, fig=fig) # save BEFORE show
-            if self._display_plot.get():
-                plt.show()
-            else:
-                plt.close(fig)
+            self._load_and_plot(plotter, x_file, x_col)
 
         elif self.mode == "plot_bode":
             plotter.plot_type     = "bode"
@@ -1121,23 +1500,14 @@ class Window3_Config(tk.Tk):
 
             # Populate plotter attributes so plot_data() works AND the pickle
             # is complete (mirrors what plot_bode() does before calling plot_data).
+            plotter.x_file        = first_in_fname
             plotter.x_data        = first_in_col
-            plotter.x_data_values = np.array(
-                self.dataframes[first_in_fname][first_in_col])
 
             columns = {}
             for fname, out_col, in_fname, in_col, lbl in pairs:
                 columns.setdefault(fname, []).append((out_col, lbl))
             plotter.columns = {f: tuple(v) for f, v in columns.items()}
-
-            plotter.save_data_plot = _noop   # handled by _gui_save
-            plotter.plot_data()
-            fig = plt.gcf()                  # capture fully-drawn figure
-            self._gui_save(plotter, fig=fig) # save BEFORE show
-            if self._display_plot.get():
-                plt.show()
-            else:
-                plt.close(fig)
+            self._load_and_plot(plotter, first_in_fname, first_in_col)
 
 
 # ============================================================================